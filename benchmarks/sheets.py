@@ -0,0 +1,165 @@
+"""Benchmarks for reading, writing and grading grading sheets.
+
+Generates a template and a graded sheet of the given size in memory, so the
+numbers do not depend on a course or on the disk. Run it from the root of
+the repository:
+
+    uv run python benchmarks/sheets.py io
+    uv run python benchmarks/sheets.py grading
+
+Each timing is the best of several repeats, per sheet.
+"""
+
+import argparse
+import gc
+import io
+import sys
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+from ruamel.yaml import YAML
+
+from staffeli_nt import vas
+from staffeli_nt.util import create_yaml
+
+REPEATS = 5
+
+
+def make_template(tasks: int) -> str:
+    """Return the text of a template with the given number of tasks."""
+    lines = ['name: Benchmark', 'passing-points: 1', 'tasks:']
+    for i in range(1, tasks + 1):
+        lines += [
+            f'  - task{i}:',
+            f'      title: Task {i}',
+            '      points: 3',
+            '      rubric: |',
+            '        [+] Handles the common case',
+            '        [-] Misses an edge case',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def make_sheet(template: vas.Assignment, students: int) -> vas.GradingSheet:
+    """Return a graded sheet for the template, as download creates it."""
+    members = [
+        SimpleNamespace(id=1000 + i, name=f'Student {i}', login_id=f'abc{i:03}@ku.dk')
+        for i in range(students)
+    ]
+    sheet = vas.create_sheet(template, members)
+    for solution in sheet.solutions:
+        solution.grade = 2
+    return sheet
+
+
+def dump_sheet(data) -> str:
+    """Return the YAML text of a serialized sheet as written by ruamel.yaml."""
+    stream = io.StringIO()
+    create_yaml().dump(data, stream)
+    return stream.getvalue()
+
+
+def best(stmt, number: int) -> float:
+    """Return the best time of one call of stmt, in milliseconds."""
+    return min(timeit.repeat(stmt, number=number, repeat=REPEATS)) / number * 1000
+
+
+def bench_io(args: argparse.Namespace) -> None:
+    template = vas.parse_template(make_template(args.tasks))
+    data = make_sheet(template, args.students).serialize()
+    text = dump_sheet(data)
+    if vas.emit_sheet_yaml(data) != text:
+        print('The emitter does not handle this sheet, download falls back to ruamel.yaml')
+    c_parser = YAML(typ='safe').Parser.__name__ == 'CParser'
+    loader = 'safe loader' + (' with clib' if c_parser else ' without clib')
+    number = args.number
+
+    print(f'{args.tasks} tasks, {args.students} students, {text.count(chr(10))} lines per sheet')
+    print(f'write grade.yml: ruamel.yaml {best(lambda: dump_sheet(data), number):.3f} ms')
+    print(f'                 emitter     {best(lambda: vas.emit_sheet_yaml(data), number):.3f} ms')
+    print(f'parse grade.yml: round-trip  {best(lambda: create_yaml().load(text), number):.3f} ms')
+    print(f'                 {loader} {best(lambda: vas.parse_sheet(text), number):.3f} ms')
+
+
+def best_fresh(texts: list[str], call, prepare=None) -> float:
+    """Return the best time of call on each of a batch of freshly parsed sheets, in microseconds.
+
+    Sheets remember their grade and feedback, so every repeat parses new ones.
+    prepare, if given, is called on each sheet before the timing starts.
+    """
+    times = []
+    for _ in range(REPEATS):
+        sheets = [vas.parse_sheet(text) for text in texts]
+        if prepare is not None:
+            for sheet in sheets:
+                prepare(sheet)
+        start = timeit.default_timer()
+        for sheet in sheets:
+            call(sheet)
+        times.append(timeit.default_timer() - start)
+    return min(times) / len(texts) * 1_000_000
+
+
+def bench_grading(args: argparse.Namespace) -> None:
+    template = vas.parse_template(make_template(args.tasks))
+    texts = [dump_sheet(make_sheet(template, args.students).serialize())] * args.number
+
+    def all_uses(sheet):
+        sheet.is_graded(template)
+        sheet.get_grade(template)
+        template.format_md(sheet)
+
+    def grade(sheet):
+        sheet.get_grade(template)
+
+    # The first parse creates the loader, which is not part of the sheets, and
+    # parsing leaves cyclic garbage behind that is collected before measuring
+    vas.parse_sheet(texts[0])
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sheets = [vas.parse_sheet(text) for text in texts]
+    gc.collect()
+    size = (tracemalloc.get_traced_memory()[0] - before) / len(sheets) / 1024
+    tracemalloc.stop()
+    del sheets
+
+    print(f'{args.tasks} tasks, {args.students} students per sheet')
+    print(f'is_graded + get_grade + format_md: {best_fresh(texts, all_uses):8.1f} us')
+    print(f'format_md:                         {best_fresh(texts, template.format_md):8.1f} us')
+    print(f'get_grade, first call:             {best_fresh(texts, grade):8.1f} us')
+    print(f'get_grade, second call:            {best_fresh(texts, grade, grade):8.1f} us')
+    print(f'memory of a parsed sheet:          {size:8.1f} KiB')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--number', type=int, default=200, metavar='N', help='calls per repeat (default: 200)'
+    )
+    benchmarks = parser.add_subparsers(dest='benchmark', required=True)
+
+    parser_io = benchmarks.add_parser('io', help='parse and write grade.yml')
+    parser_io.add_argument('--tasks', type=int, default=12, help='tasks per sheet (default: 12)')
+    parser_io.add_argument(
+        '--students', type=int, default=2, help='students per sheet (default: 2)'
+    )
+    parser_io.set_defaults(main=bench_io)
+
+    parser_grading = benchmarks.add_parser('grading', help='grade and render feedback of sheets')
+    parser_grading.add_argument(
+        '--tasks', type=int, default=50, help='tasks per sheet (default: 50)'
+    )
+    parser_grading.add_argument(
+        '--students', type=int, default=2, help='students per sheet (default: 2)'
+    )
+    parser_grading.set_defaults(main=bench_grading)
+
+    args = parser.parse_args()
+    print(f'Python {sys.version.split()[0]}')
+    args.main(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ from importlib.metadata import PackageNotFoundError, version
 from pathlib import Path
 from typing import Optional
 
-from staffeli_nt import download, info, scan, upload, upload_single
+from staffeli_nt import download, gradebook, info, scan, stats, upload, upload_single
 from staffeli_nt.console import print_error, set_debug_mode
 
 
@@ -52,6 +52,17 @@ def main() -> None:
         metavar='PATH',
         help='path to Canvas token file (default: ~/.canvas.token)',
     )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='ignore cached course metadata and fetch it again from Canvas',
+    )
+    parser.add_argument(
+        '--mirror',
+        type=str,
+        metavar='PATH',
+        help='keep a local SQLite mirror of the course at PATH and read from it',
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
@@ -61,7 +72,9 @@ def main() -> None:
     # Add all subparsers
     subparsers = parser.add_subparsers(title='subcommands', dest='subcommand')
     scan.add_subparser(subparsers)
+    stats.add_subparser(subparsers)
     download.add_subparser(subparsers)
+    gradebook.add_subparser(subparsers)
     info.add_subparser(subparsers)
     upload.add_subparser(subparsers)
     upload_single.add_subparser(subparsers)
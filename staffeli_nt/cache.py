@@ -0,0 +1,200 @@
+"""Persistent on-disk cache for Canvas course metadata.
+
+Course, assignment, section and roster listings rarely change while a course
+is being graded, yet every staffeli invocation used to fetch them again. The
+cache keeps them in one JSON file per course, with a time-to-live per kind of
+entity. Expired single-page entries are revalidated with ``If-None-Match``, so
+an unchanged listing costs one 304 response instead of a full download.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from canvasapi.assignment import Assignment  # type: ignore[import-untyped]
+from canvasapi.course import Course  # type: ignore[import-untyped]
+from canvasapi.requester import Requester  # type: ignore[import-untyped]
+from canvasapi.section import Section  # type: ignore[import-untyped]
+from canvasapi.user import User  # type: ignore[import-untyped]
+from canvasapi.util import get_institution_url  # type: ignore[import-untyped]
+
+from . import console as con
+from .util import PER_PAGE, follow_pages
+
+# Time-to-live in seconds per kind of cached entity
+TTL = {
+    'course': 24 * 60 * 60,
+    'assignments': 10 * 60,
+    'sections': 24 * 60 * 60,
+    'roster': 60 * 60,
+}
+
+
+def cache_dir() -> Path:
+    """Return the directory holding the metadata cache files.
+
+    The files hold the course roster, so the directories are created for,
+    and the files readable by, the current user only.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(Path.home(), '.cache')
+    return Path(base) / 'staffeli_nt'
+
+
+class MetadataCache:
+    """Cached access to the metadata of a single course.
+
+    Entries are namespaced by a hash of the API url and token, since what a
+    token can see depends on the permissions of its owner.
+    """
+
+    def __init__(self, api_url: str, api_key: str, course_id, refresh: bool = False):
+        self.requester = Requester(get_institution_url(api_url), api_key)
+        self.course_id = int(course_id)
+        self.refresh = refresh
+        namespace = hashlib.sha256(f'{api_url}\n{api_key}'.encode()).hexdigest()[:16]
+        self.path = cache_dir() / namespace / f'course-{self.course_id}.json'
+        self._entries: dict[str, Any] = self._load()
+
+    def _load(self) -> dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            con.print_debug(f'Ignoring unreadable metadata cache: {self.path}')
+            con.print_debug(con.format_exception_debug(e))
+            return {}
+
+    def _save(self) -> None:
+        try:
+            for directory in (cache_dir(), self.path.parent):
+                directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+                os.chmod(directory, 0o700)
+            # A temporary file of its own, as other runs may save the same course meanwhile,
+            # created readable by the current user only
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f'{self.path.stem}.', suffix='.tmp', dir=self.path.parent
+            )
+            try:
+                with open(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            con.print_debug(f'Failed to write metadata cache: {self.path}')
+            con.print_debug(con.format_exception_debug(e))
+
+    def fetch(self, kind: str, endpoint: str, params: list[tuple[str, Any]] | None = None) -> Any:
+        """Return the JSON for a GET endpoint, from the cache if it is still fresh.
+
+        List endpoints are followed across all pages. Only single-page
+        responses keep their ETag, as the ETag of a first page says nothing
+        about the pages after it.
+
+        Args:
+            kind: Kind of entity, selects the time-to-live from TTL
+            endpoint: Canvas API endpoint relative to the API root
+            params: Request parameters as (name, value) pairs
+
+        Returns:
+            The decoded JSON (concatenated across pages for listings)
+        """
+        params = params or []
+        key = endpoint + '?' + '&'.join(f'{k}={v}' for k, v in sorted(params))
+        entry = self._entries.get(key)
+        now = time.time()
+
+        if entry is not None and not self.refresh and now - entry['fetched_at'] < TTL[kind]:
+            return entry['data']
+
+        headers = {}
+        if entry is not None and entry.get('etag') and not self.refresh:
+            headers['If-None-Match'] = entry['etag']
+
+        response = self.requester.request(
+            'GET', endpoint, headers=headers, _kwargs=params + [('per_page', PER_PAGE)]
+        )
+        if response.status_code == 304 and entry is not None:
+            con.print_debug(f'Metadata cache revalidated: {endpoint}')
+            entry['fetched_at'] = now
+            self._save()
+            return entry['data']
+
+        data = response.json()
+        etag = response.headers.get('ETag')
+        if isinstance(data, list):
+            more = list(follow_pages(self.requester, response, lambda page: page.json()))
+            if more:
+                data.extend(more)
+                etag = None
+
+        self._entries[key] = {'fetched_at': now, 'etag': etag, 'data': data}
+        self._save()
+        return data
+
+    def get_course(self) -> Course:
+        data = self.fetch('course', f'courses/{self.course_id}')
+        return Course(self.requester, data)
+
+    def assignments_data(self) -> list[dict[str, Any]]:
+        data: list[dict[str, Any]] = self.fetch(
+            'assignments', f'courses/{self.course_id}/assignments'
+        )
+        return data
+
+    def get_assignments(self) -> list[Assignment]:
+        return [
+            Assignment(self.requester, {**a, 'course_id': self.course_id})
+            for a in self.assignments_data()
+        ]
+
+    def get_assignment(self, assignment_id) -> Assignment:
+        for assignment in self.get_assignments():
+            if assignment.id == int(assignment_id):
+                return assignment
+        data = self.fetch('assignments', f'courses/{self.course_id}/assignments/{assignment_id}')
+        return Assignment(self.requester, {**data, 'course_id': self.course_id})
+
+    def sections_data(self) -> list[dict[str, Any]]:
+        data: list[dict[str, Any]] = self.fetch('sections', f'courses/{self.course_id}/sections')
+        return data
+
+    def get_sections(self) -> list[Section]:
+        return [
+            Section(self.requester, {**s, 'course_id': self.course_id})
+            for s in self.sections_data()
+        ]
+
+    def get_section(self, section_id) -> Section:
+        """Return a section including its students and their enrollments."""
+        data = self.fetch(
+            'roster',
+            f'courses/{self.course_id}/sections/{section_id}',
+            [('include[]', 'students'), ('include[]', 'enrollments')],
+        )
+        return Section(self.requester, {**data, 'course_id': self.course_id})
+
+    def students_data(self) -> list[dict[str, Any]]:
+        """Return every active student in the course, including enrollments and email."""
+        data: list[dict[str, Any]] = self.fetch(
+            'roster',
+            f'courses/{self.course_id}/users',
+            [
+                ('enrollment_type[]', 'student'),
+                ('enrollment_state[]', 'active'),
+                ('include[]', 'enrollments'),
+                ('include[]', 'email'),
+            ],
+        )
+        return data
+
+    def get_students(self) -> list[User]:
+        return [User(self.requester, u) for u in self.students_data()]
@@ -4,7 +4,7 @@ This module provides a single Rich Console instance with consistent styling
 and theming for all terminal output in the application.
 """
 
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable
 from typing import TypeVar
 
 from rich.console import Console
@@ -53,6 +53,10 @@ def set_debug_mode(enabled: bool) -> None:
     _debug_enabled = enabled
 
 
+def is_debug_mode() -> bool:
+    return _debug_enabled
+
+
 def print_error(message: str) -> None:
     """Print an error message in red with bold 'Error:' prefix.
 
@@ -144,6 +148,35 @@ def print_verbose(message: str) -> None:
         console.print(f'  {line}')
 
 
+class BufferedOutput:
+    """Collects messages to print them later in one go.
+
+    Used by parallel workers, so that the output for each item stays together
+    and items are reported in a deterministic order.
+    """
+
+    def __init__(self) -> None:
+        self.messages: list[tuple[Callable[[str], None], str]] = []
+
+    def info(self, message: str) -> None:
+        self.messages.append((print_info, message))
+
+    def warning(self, message: str) -> None:
+        self.messages.append((print_warning, message))
+
+    def error(self, message: str) -> None:
+        self.messages.append((print_error, message))
+
+    def debug(self, message: str) -> None:
+        self.messages.append((print_debug, message))
+
+    def flush(self) -> None:
+        """Print and forget all collected messages."""
+        for printer, message in self.messages:
+            printer(message)
+        self.messages.clear()
+
+
 def format_exception_debug(e: Exception, include_trace: bool = True) -> str:
     """Format exception details for debug output.
 
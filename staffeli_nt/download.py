@@ -8,6 +8,7 @@ import shutil
 import sys
 import threading
 import zipfile
+from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Tuple
 from zipfile import BadZipFile
@@ -17,7 +18,11 @@ from canvasapi.exceptions import CanvasException, RateLimitExceeded  # type: ign
 
 from . import console as con
 from . import vas
-from .util import download, download_streaming, dump_yaml, run_onlineTA
+from .cache import MetadataCache
+from .gradebook import NAME_GRADEBOOK, store_sheets
+from .mirror import open_mirror
+from .sheets import write_locations
+from .util import download, download_streaming, dump_yaml, paginate, run_onlineTA
 
 # Canvas API rate limit settings
 MAX_API_WORKERS = 50
@@ -59,7 +64,25 @@ def grab_submission_comments(submission) -> str:
     return '\n'.join(sorted(comments))
 
 
-def get_student_ids(canvas, course, course_id, select_ta, select_section, tas, stud):
+def get_roster_index(students) -> Dict[str, int]:
+    """
+    Index the active students of a course (as listed by MetadataCache.get_students).
+
+    Returns:
+        dict mapping both kuid and full login id (lower case) to Canvas user id
+    """
+    roster: Dict[str, int] = {}
+    for user in students:
+        login_id = getattr(user, 'login_id', None)
+        if not login_id:
+            continue
+        login_id = login_id.lower()
+        roster[login_id] = user.id
+        roster[kuid(login_id)] = user.id
+    return roster
+
+
+def get_student_ids(canvas, cache, course_id, select_ta, select_section, tas, stud):
     """
     Get list of student IDs based on selection criteria.
 
@@ -70,18 +93,25 @@ def get_student_ids(canvas, course, course_id, select_ta, select_section, tas, s
 
     if select_ta:
         index = con.ask_menu('Select TA', tas)
-        students = []
+        roster = get_roster_index(cache.get_students())
+        student_ids = []
+        unknown = []
         for i in stud[index]:
-            # Need full user lookup for search_term matching
-            students += course.get_users(
-                search_term=i, enrollment_type=['student'], enrollment_state='active'
+            sid = roster.get(str(i).lower())
+            if sid is None:
+                unknown.append(str(i))
+            elif sid not in student_ids:
+                student_ids.append(sid)
+        if unknown:
+            con.print_warning(
+                f'{len(unknown)} kuid(s) for {tas[index]} are not active students in the course:\n'
+                + ', '.join(unknown)
             )
-        student_ids = [s.id for s in students]
 
     elif select_section:
-        sections = sort_by_name(course.get_sections())
+        sections = sort_by_name(cache.get_sections())
         index = con.ask_menu('Select Section', [sec.name for sec in sections])
-        section = course.get_section(sections[index].id, include=['students', 'enrollments'])
+        section = cache.get_section(sections[index].id)
         student_ids = [
             s['id']
             for s in section.students
@@ -140,11 +170,68 @@ def get_student_ids(canvas, course, course_id, select_ta, select_section, tas, s
     return student_ids, section
 
 
-def validate_inputs(path_destination: str, path_template: str, select_ta: str | None):
+def is_resubmission_candidate(submission) -> bool:
+    """Whether a submission has files and is either ungraded or scored below 1.0."""
+    if not getattr(submission, 'attachments', None):
+        return False
+    # If a submission has not yet been graded, submission.score will be None
+    score = getattr(submission, 'score', None)
+    return score is None or score < 1.0
+
+
+def select_resubmissions(course, assignment, student_ids, since, mirror):
+    """
+    Narrow student_ids down to resubmission candidates using one bulk listing
+    of submission metadata (or the mirror), before any comments are fetched.
+
+    Args:
+        since: Optional aware datetime, only submissions submitted after it are candidates
+
+    Returns:
+        tuple: (candidate_ids, empty_ids) where empty_ids handed in nothing
+    """
+    wanted = set(student_ids)
+    if mirror is not None:
+        submissions = mirror.submissions(assignment.id, wanted)
+    else:
+        # Sent as an ISO 8601 string, like the timestamps of mirror._sync_submissions
+        kwargs = {'submitted_since': since.isoformat()} if since is not None else {}
+        submissions = paginate(
+            course.get_multiple_submissions(
+                student_ids=['all'], assignment_ids=[assignment.id], **kwargs
+            )
+        )
+
+    candidate_ids = []
+    handed_in = set()
+    for submission in submissions:
+        if submission.user_id not in wanted:
+            continue
+        if getattr(submission, 'attachments', None):
+            handed_in.add(submission.user_id)
+        submitted_at = getattr(submission, 'submitted_at_date', None)
+        if since is not None and (submitted_at is None or submitted_at <= since):
+            continue
+        if is_resubmission_candidate(submission):
+            candidate_ids.append(submission.user_id)
+
+    # With a since filter the listing only covers recent submissions, so
+    # older handins cannot be told apart from empty ones
+    empty_ids = [] if since is not None else [i for i in student_ids if i not in handed_in]
+    con.print_info(
+        f'Found {len(candidate_ids)} resubmission candidate(s) among {len(student_ids)} students'
+    )
+    return candidate_ids, empty_ids
+
+
+def validate_inputs(
+    path_destination: str, path_template: str, select_ta: str | None, since: str | None
+):
     """Validate all local inputs before making network requests.
 
     Returns:
-        tuple: (template, tas, stud) where tas and stud are None if select_ta is not used
+        tuple: (template, tas, stud, since) where tas and stud are None if select_ta
+        is not used, and since is an aware datetime or None
     """
     if os.path.exists(path_destination):
         con.print_error(
@@ -160,20 +247,42 @@ def validate_inputs(path_destination: str, path_template: str, select_ta: str |
     if select_ta is not None:
         (tas, stud) = vas.load_students_and_tas_or_exit(select_ta)
 
-    return (template, tas, stud)
+    since_date = None
+    if since is not None:
+        try:
+            # Timestamps without a timezone are taken to be local time
+            since_date = datetime.fromisoformat(since).astimezone()
+        except ValueError:
+            con.print_error(
+                f"Invalid --since timestamp '{since}'.\n"
+                'Use ISO 8601 format, e.g. 2024-10-01 or 2024-10-01T12:00.'
+            )
+            sys.exit(1)
+
+    return (template, tas, stud, since_date)
 
 
 def process_submission(
-    student_id, assignment, course, resubmissions_only, cancel_event, retry_count=0
+    student_id,
+    assignment,
+    course,
+    users,
+    mirror,
+    cancel_event,
+    retry_count=0,
 ):
     """
     Fetches and processes a single submission for a student.
+    The submission is read from the mirror and the user from the users roster
+    when present, falling back to Canvas otherwise.
     Handles its own rate limiting with retries and random jitter.
     Uses cancel_event to allow interrupting retry delays.
     """
     try:
-        submission = assignment.get_submission(student_id, include=['submission_comments'])
-        user = course.get_user(student_id)
+        submission = mirror.submission(assignment.id, student_id) if mirror else None
+        if submission is None:
+            submission = assignment.get_submission(student_id, include=['submission_comments'])
+        user = users[student_id] if student_id in users else course.get_user(student_id)
     except (RateLimitExceeded, CanvasException) as e:
         # Check if it's a rate limit error (status 429)
         if '429' in str(e) or isinstance(e, RateLimitExceeded):
@@ -193,7 +302,8 @@ def process_submission(
                     student_id,
                     assignment,
                     course,
-                    resubmissions_only,
+                    users,
+                    mirror,
                     cancel_event,
                     retry_count + 1,
                 )
@@ -204,35 +314,16 @@ def process_submission(
 
     if hasattr(submission, 'attachments') and len(submission.attachments) > 0:
         con.print_info(f'User {user.name} handed in something')
-        # NOTE: This is a terribly hacky solution and should really be rewritten
-        # collect which attachments to download
-        # if only fetching resubmissions
-        if resubmissions_only:
-            if hasattr(submission, 'score'):
-                con.print_info(f'Score: {submission.score}')
-                # If a submission has not yet been graded, submission.score will be None
-                if submission.score is None or submission.score < 1.0:
-                    files = [s for s in submission.attachments]
-                    # tag entire handin
-                    uuid = '-'.join(sorted([str(a.id) for a in files]))
-                    handin_data = {
-                        'files': files,
-                        'students': [user],
-                        'comments': grab_submission_comments(submission),
-                    }
-                    result.update({'is_empty': False, 'uuid': uuid, 'handin_data': handin_data})
-        # else, grab everything
-        else:
-            files = [s for s in submission.attachments]
-
-            # tag entire handin
-            uuid = '-'.join(sorted([str(a.id) for a in files]))
-            handin_data = {
-                'files': files,
-                'students': [user],
-                'comments': grab_submission_comments(submission),
-            }
-            result.update({'is_empty': False, 'uuid': uuid, 'handin_data': handin_data})
+        files = [s for s in submission.attachments]
+
+        # tag entire handin
+        uuid = '-'.join(sorted([str(a.id) for a in files]))
+        handin_data = {
+            'files': files,
+            'students': [user],
+            'comments': grab_submission_comments(submission),
+        }
+        result.update({'is_empty': False, 'uuid': uuid, 'handin_data': handin_data})
 
     return result
 
@@ -247,6 +338,9 @@ def process_handin(item: Tuple[str, Dict[str, Any]], home: str, template: Any, p
         home: Home directory for submissions
         template: Grading template
         progress: Optional Progress instance for showing file download progress
+
+    Returns:
+        (path, sheet) of the grading sheet created for the handin
     """
     uuid, handin = item
     student_names = ', '.join([u.name for u in handin['students']])
@@ -354,7 +448,9 @@ def process_handin(item: Tuple[str, Dict[str, Any]], home: str, template: Any, p
     # create grading sheet from template
     grade = os.path.join(base, 'grade.yml')
     sheet = vas.create_sheet(template, sorted(handin['students'], key=lambda u: u.login_id))
-    if not dump_yaml(grade, sheet.serialize(), f'grading sheet (submission: {name})'):
+    if not dump_yaml(
+        grade, sheet.serialize(), f'grading sheet (submission: {name})', emit=vas.emit_sheet_yaml
+    ):
         error_msg = f'Failed to write grading sheet: {grade}\nSubmission: {name}'
         raise RuntimeError(error_msg)
 
@@ -379,6 +475,8 @@ def process_handin(item: Tuple[str, Dict[str, Any]], home: str, template: Any, p
             con.print_debug(con.format_exception_debug(e))
             raise RuntimeError(error_msg) from e
 
+    return grade, sheet
+
 
 def add_subparser(subparsers: argparse._SubParsersAction):
     parser: argparse.ArgumentParser = subparsers.add_parser(
@@ -403,6 +501,17 @@ def add_subparser(subparsers: argparse._SubParsersAction):
     parser.add_argument(
         '--resub', action='store_true', help='whether only resubmissions should be fetched'
     )
+    parser.add_argument(
+        '--since',
+        type=str,
+        metavar='TIMESTAMP',
+        help='with --resub, only fetch submissions handed in after TIMESTAMP (ISO 8601)',
+    )
+    parser.add_argument(
+        '--gradebook',
+        action='store_true',
+        help=f'also store the new grading sheets in {NAME_GRADEBOOK}',
+    )
     parser.add_argument(
         '--buffersize',
         type=int,
@@ -422,12 +531,17 @@ def main(api_url, api_key, args: argparse.Namespace):
     resubmissions_only = args.resub
     buffersize = args.buffersize
 
-    template, tas, stud = validate_inputs(path_destination, path_template, select_ta)
+    template, tas, stud, since = validate_inputs(
+        path_destination, path_template, select_ta, args.since
+    )
+    if since is not None and not resubmissions_only:
+        con.print_warning('--since only has an effect together with --resub')
 
     # --- Sequential Setup Phase ---
     canvas = Canvas(api_url, api_key)
-    course = canvas.get_course(course_id)
-    assignments = sort_by_name(course.get_assignments())
+    cache = MetadataCache(api_url, api_key, course_id, refresh=args.refresh)
+    course = cache.get_course()
+    assignments = sort_by_name(cache.get_assignments())
     index = con.ask_menu(
         'Select Assignment', [a.name for a in assignments], default=len(assignments) - 1
     )
@@ -435,12 +549,25 @@ def main(api_url, api_key, args: argparse.Namespace):
 
     # Get student IDs based on selection criteria (TA/section/all)
     student_ids, section = get_student_ids(
-        canvas, course, course_id, select_ta, select_section, tas, stud
+        canvas, cache, course_id, select_ta, select_section, tas, stud
     )
+    mirror = open_mirror(args.mirror, cache)
+    if mirror is not None:
+        mirror.sync(assignment.id, full=args.refresh)
+        users = mirror.users()
+    else:
+        users = {u.id: u for u in cache.get_students()}
+
+    empty_ids = []
+    if resubmissions_only:
+        student_ids, empty_ids = select_resubmissions(
+            course, assignment, student_ids, since, mirror
+        )
 
     os.mkdir(path_destination)
 
     handins: Dict[str, Any] = {}
+    sheets: list[tuple[str, vas.GradingSheet]] = []
     participants = []
     empty_handins = []
 
@@ -457,7 +584,7 @@ def main(api_url, api_key, args: argparse.Namespace):
                 f'Processing {len(student_ids)} submissions',
                 executor.map(
                     lambda sid: process_submission(
-                        sid, assignment, course, resubmissions_only, cancel_event
+                        sid, assignment, course, users, mirror, cancel_event
                     ),
                     student_ids,
                     buffersize=buffersize,
@@ -467,6 +594,10 @@ def main(api_url, api_key, args: argparse.Namespace):
         )
 
         # --- Phase 2: Reduce results to build handins dictionary ---
+        processed_results += [
+            {'user': users[sid] if sid in users else course.get_user(sid), 'is_empty': True}
+            for sid in empty_ids
+        ]
         for result in processed_results:
             user = result['user']
             participants.append(vas.create_student(user))
@@ -490,11 +621,12 @@ def main(api_url, api_key, args: argparse.Namespace):
             )
 
             # Process with buffersize and track overall progress
-            for _ in executor.map(
+            for sheet_path, sheet in executor.map(
                 lambda item: process_handin(item, path_destination, template, progress),
                 handins.items(),
                 buffersize=buffersize,
             ):
+                sheets.append((sheet_path, sheet))
                 progress.update(overall_task, advance=1)
     except Exception as e:
         # Determine error type and show appropriate message
@@ -547,3 +679,7 @@ def main(api_url, api_key, args: argparse.Namespace):
         ),
     )
     dump_yaml(meta_path, meta_data.serialize(), 'assignment metadata', exit_on_error=True)
+
+    write_locations(path_destination, [path for path, _ in sheets])
+    if args.gradebook:
+        store_sheets(path_destination, sheets)
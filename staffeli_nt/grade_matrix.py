@@ -0,0 +1,249 @@
+"""Grades of a whole assignment as a students x tasks matrix.
+
+``stats`` loads every grading sheet into dense NumPy arrays: the grade of each
+task without bonus (NaN where it is not graded), the bonus of each task, and
+whether each sheet is graded in full. Statistics are then computed over whole
+columns and rows at once, which keeps them fast on thousands of sheets.
+
+NumPy is an optional dependency, installed with the ``stats`` extra.
+"""
+
+import csv
+import os
+import warnings
+
+import numpy as np
+
+from .scan_index import SheetSummary
+from .sheets import relative_path, ta_directory
+from .vas import Assignment
+
+OUTLIER_Z = 3.5  # Robust z-score of a total above which a student is an outlier
+HISTOGRAM_BINS = 8
+
+
+class GradeMatrix:
+    """Grades per student and task, one row per student and one column per task."""
+
+    def __init__(
+        self,
+        tasks: list[str],
+        max_points: np.ndarray,
+        grades: np.ndarray,
+        bonus: np.ndarray,
+        complete: np.ndarray,
+        students: np.ndarray,
+        sheets: list[str],
+        graders: list[str],
+        passing_points: int | None,
+    ):
+        """
+        Args:
+            tasks: Task names, one per column
+            max_points: Points of each task, NaN for tasks without points
+            grades: Grade of each student and task without bonus, NaN if not graded
+            bonus: Bonus of each student and task
+            complete: Whether the sheet of each student is graded in full
+            students: Student ids, one per row
+            sheets: Directory of the sheet of each student, relative to the root
+            graders: TA directory of the sheet of each student
+            passing_points: Points needed to pass, if the assignment is pass/fail
+        """
+        self.tasks = tasks
+        self.max_points = max_points
+        self.grades = grades
+        self.bonus = bonus
+        self.graded = ~np.isnan(grades)
+        self.complete = complete
+        self.students = students
+        self.sheets = sheets
+        self.graders = graders
+        self.passing_points = passing_points
+
+    @classmethod
+    def from_summaries(
+        cls, path_submissions: str, summaries: list[tuple[str, SheetSummary]], tmpl: Assignment
+    ) -> 'GradeMatrix':
+        rows = []
+        bonus = []
+        complete = []
+        students = []
+        sheets = []
+        graders = []
+        for path, summary in summaries:
+            sheet = os.path.dirname(relative_path(path_submissions, path))
+            grader = ta_directory(path_submissions, path)
+            for student in summary.students:
+                rows.append(summary.tasks)
+                bonus.append(summary.bonus)
+                complete.append(summary.graded)
+                students.append(student)
+                sheets.append(sheet)
+                graders.append(grader)
+
+        shape = (len(rows), len(tmpl.tasks))
+        return cls(
+            tasks=[task.name for task in tmpl.tasks],
+            max_points=np.array([task.points for task in tmpl.tasks], dtype=float),
+            # None becomes NaN
+            grades=np.array(rows, dtype=float).reshape(shape),
+            bonus=np.array(bonus, dtype=float).reshape(shape),
+            complete=np.array(complete, dtype=bool),
+            students=np.array(students, dtype=np.int64),
+            sheets=sheets,
+            graders=graders,
+            passing_points=tmpl.passing_points,
+        )
+
+    def totals(self) -> np.ndarray:
+        """Points of each student including bonus, NaN unless graded in full."""
+        points = np.where(self.graded, self.grades, 0).sum(axis=1) + self.bonus.sum(axis=1)
+        return np.where(self.complete, points, np.nan)
+
+    def total_stats(self) -> dict[str, float]:
+        """Count, mean, median, minimum and maximum of the totals of students graded in full."""
+        totals = self.totals()[self.complete]
+        if not len(totals):
+            return {'count': 0}
+        return {
+            'count': len(totals),
+            'mean': float(totals.mean()),
+            'median': float(np.median(totals)),
+            'min': float(totals.min()),
+            'max': float(totals.max()),
+        }
+
+    def passed(self) -> np.ndarray | None:
+        """Whether each student graded in full passes, or None without passing points."""
+        if self.passing_points is None:
+            return None
+        passed: np.ndarray = self.totals()[self.complete] >= self.passing_points
+        return passed
+
+    def task_stats(self) -> dict[str, np.ndarray]:
+        """Per-task count, mean, standard deviation, quartiles and shares of full and no marks."""
+        count = self.graded.sum(axis=0)
+        values = np.where(self.graded, self.grades, 0)
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = values.sum(axis=0) / count
+            std = np.sqrt(np.where(self.graded, (self.grades - mean) ** 2, 0).sum(axis=0) / count)
+            q1, median, q3 = np.nanpercentile(self.grades, [25, 50, 75], axis=0)
+            full = (self.graded & (self.grades >= self.max_points)).sum(axis=0) / count
+            zero = (self.graded & (self.grades == 0)).sum(axis=0) / count
+        return {
+            'count': count,
+            'mean': mean,
+            'std': std,
+            'q1': q1,
+            'median': median,
+            'q3': q3,
+            'full': full,
+            'zero': zero,
+        }
+
+    def histograms(self) -> tuple[np.ndarray, np.ndarray]:
+        """Count the grades of each task in equal bins from 0 to the task's points.
+
+        Tasks worth fewer than HISTOGRAM_BINS points get one bin per whole
+        point, so that whole-point grades do not leave empty bins between them.
+
+        Returns:
+            The counts per task and bin, and the number of bins used per task
+        """
+        bins = np.where(
+            self.max_points < HISTOGRAM_BINS, np.floor(self.max_points) + 1, HISTOGRAM_BINS
+        )
+        bins = np.nan_to_num(bins, nan=1).astype(int)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = self.grades / self.max_points
+        index = np.clip(np.nan_to_num(np.floor(share * bins)), 0, bins - 1).astype(int)
+        usable = self.graded & np.isfinite(share)
+        onehot = (index[:, :, None] == np.arange(HISTOGRAM_BINS)) & usable[:, :, None]
+        return onehot.sum(axis=0), bins
+
+    def outliers(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows whose total is far from the median, and their robust z-scores.
+
+        The z-score uses the median absolute deviation, so the outliers
+        themselves do not hide each other. Rows are sorted by distance.
+        """
+        totals = self.totals()
+        rows = np.flatnonzero(self.complete)
+        if len(rows) < 3:
+            return rows[:0], np.zeros(0)
+        values = totals[rows]
+        median = np.median(values)
+        mad = np.median(np.abs(values - median))
+        scale = 1.4826 * mad if mad > 0 else values.std()
+        if scale == 0:
+            return rows[:0], np.zeros(0)
+        z = (values - median) / scale
+        far = np.abs(z) > OUTLIER_Z
+        order = np.argsort(-np.abs(z[far]))
+        return rows[far][order], z[far][order]
+
+    def grader_stats(self) -> tuple[list[str], dict[str, np.ndarray]]:
+        """Per-TA-directory counts, mean total, pass rate and largest task deviation.
+
+        Returns:
+            The TA directories, and per statistic an array with one value each
+        """
+        names, group = np.unique(np.array(self.graders, dtype=object), return_inverse=True)
+        onehot = (group[None, :] == np.arange(len(names))[:, None]).astype(float)
+        totals = self.totals()
+
+        students = onehot.sum(axis=1)
+        complete = onehot @ self.complete
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (onehot @ np.where(self.complete, totals, 0)) / complete
+            task_mean = (onehot @ np.where(self.graded, self.grades, 0)) / (onehot @ self.graded)
+            deviation = task_mean - self.task_stats()['mean']
+        worst = np.argmax(np.nan_to_num(np.abs(deviation), nan=-1), axis=1)
+        stats = {
+            'students': students,
+            'complete': complete,
+            'mean': mean,
+            'worst_task': worst,
+            'worst_deviation': deviation[np.arange(len(names)), worst],
+        }
+        if self.passing_points is not None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                passed = self.complete & (np.nan_to_num(totals) >= self.passing_points)
+                stats['pass_rate'] = (onehot @ passed) / complete
+        return [str(name) for name in names], stats
+
+    def to_csv(self, path: str) -> None:
+        """Write one row per student, leaving grades that are not given empty."""
+        totals = self.totals()
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['student_id', 'sheet', 'grader', *self.tasks, 'bonus', 'total'])
+            for i in range(len(self.students)):
+                grades = ['' if np.isnan(g) else f'{g:g}' for g in self.grades[i]]
+                total = '' if np.isnan(totals[i]) else f'{totals[i]:g}'
+                writer.writerow(
+                    [
+                        int(self.students[i]),
+                        self.sheets[i],
+                        self.graders[i],
+                        *grades,
+                        f'{self.bonus[i].sum():g}',
+                        total,
+                    ]
+                )
+
+    def to_npz(self, path: str) -> None:
+        """Write the arrays of the matrix to a compressed NumPy archive."""
+        np.savez_compressed(
+            path,
+            tasks=np.array(self.tasks),
+            max_points=self.max_points,
+            grades=self.grades,
+            bonus=self.bonus,
+            graded=self.graded,
+            complete=self.complete,
+            students=self.students,
+            sheets=np.array(self.sheets),
+            graders=np.array(self.graders),
+        )
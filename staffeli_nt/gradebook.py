@@ -0,0 +1,426 @@
+"""Gradebook: every grading sheet of an assignment in a single SQLite file.
+
+With one ``grade.yml`` per submission, a scan opens and parses thousands of
+small files, which is slow on network file systems and in git clones. The
+gradebook keeps each sheet as a row of ``gradebook.db`` in the submissions
+root instead, so ``scan``, ``stats`` and ``upload --gradebook`` read every
+sheet with one query.
+
+``download --gradebook`` stores every sheet it creates in the gradebook as
+well as in its ``grade.yml``. ``gradebook import`` copies the ``grade.yml``
+files into the gradebook and ``gradebook export`` writes them back, so TAs who
+prefer to grade in YAML still can. Every row has a version, bumped on each
+change, and remembers the version and digest of its file as of the last
+download, import or export. Both commands use these to detect sheets changed
+on both sides since, and leave them alone unless forced, so neither side
+silently overwrites the other. ``scan`` and ``stats`` warn about sheets whose
+``grade.yml`` changed since, as they show the grades of the gradebook, and a
+live ``upload`` refuses to post them. Writes check the version they read, so
+concurrent writers cannot lose each other's changes either: SQLite locks the
+whole file while writing, the versions give each row its own optimistic
+lock. The default rollback journal is used, as WAL mode does not work on
+network file systems.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+from ruamel.yaml.scalarstring import LiteralScalarString
+
+from . import console as con
+from .scan_index import SheetSummary
+from .sheets import NAME_SHEET, find_sheets, load_sheets, relative_path
+from .util import dump_yaml
+from .vas import Assignment, GradingSheet, Solution, Student, emit_sheet_yaml
+
+NAME_GRADEBOOK = 'gradebook.db'
+BUSY_TIMEOUT = 30.0  # Seconds to wait for another process to finish writing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    path TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    file_version INTEGER,
+    file_sha256 TEXT
+);
+"""
+
+
+def encode_sheet(sheet: GradingSheet) -> str:
+    return json.dumps(
+        {
+            'name': sheet.name,
+            'students': [[s.id, s.name, s.login] for s in sheet.students],
+            'solutions': [
+                [s.name, s.grade, s.points, s.bonus, s.feedback] for s in sheet.solutions
+            ],
+        },
+        ensure_ascii=False,
+        separators=(',', ':'),
+    )
+
+
+def decode_sheet(data: str) -> GradingSheet:
+    struct = json.loads(data)
+    return GradingSheet(
+        struct['name'],
+        students=[Student(id=i, name=name, login=login) for i, name, login in struct['students']],
+        solutions=[
+            Solution(name=name, grade=grade, points=points, bonus=bonus, feedback=feedback)
+            for name, grade, points, bonus, feedback in struct['solutions']
+        ],
+    )
+
+
+def file_digest(path: str) -> str | None:
+    """Return the sha256 of a file, or None if it cannot be read."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class Row:
+    __slots__ = ('version', 'data', 'file_version', 'file_sha256')
+
+    def __init__(self, version: int, data: str, file_version: int | None, file_sha256: str | None):
+        self.version = version
+        self.data = data
+        self.file_version = file_version
+        self.file_sha256 = file_sha256
+
+
+class Gradebook:
+    """Grading sheets keyed by the path of their grade.yml, relative to the submissions root."""
+
+    def __init__(self, path: str, path_submissions: str):
+        self.path = path
+        self.root = path_submissions
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _key(self, path: str) -> str:
+        return relative_path(self.root, path).replace(os.sep, '/')
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def rows(self) -> dict[str, Row]:
+        """Return every row by the path of its sheet, in path order."""
+        return {
+            self._path(key): Row(version, data, file_version, file_sha256)
+            for key, version, data, file_version, file_sha256 in self.db.execute(
+                'SELECT path, version, data, file_version, file_sha256 FROM sheets ORDER BY path'
+            )
+        }
+
+    def sheets(self) -> tuple[list[tuple[str, GradingSheet]], list[str]]:
+        """Return (path, sheet) for every sheet that decodes, and the paths of those that do not."""
+        sheets = []
+        error_files = []
+        for path, row in self.rows().items():
+            if (sheet := self.decode(path, row.data)) is not None:
+                sheets.append((path, sheet))
+            else:
+                error_files.append(path)
+        return sheets, error_files
+
+    def stale_files(self) -> list[str]:
+        """Return the sheets whose grade.yml changed since its last download, import or export."""
+        rows = self.db.execute('SELECT path, file_sha256 FROM sheets ORDER BY path').fetchall()
+        return [
+            path
+            for path, file_sha256 in ((self._path(key), digest) for key, digest in rows)
+            if (digest := file_digest(path)) is not None and digest != file_sha256
+        ]
+
+    def decode(self, path: str, data: str) -> GradingSheet | None:
+        try:
+            return decode_sheet(data)
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            con.print_error(f'Failed to read sheet from the gradebook: {path}')
+            con.print_debug(con.format_exception_debug(e))
+            return None
+
+    def put(self, path: str, data: str, file_sha256: str, expected: Row | None) -> bool:
+        """Store a sheet read from its grade.yml, unless its row changed since expected was read.
+
+        Args:
+            path: The grade.yml the sheet was read from
+            data: The encoded sheet
+            file_sha256: Digest of the grade.yml
+            expected: The row as read before, None if there was none
+
+        Returns:
+            False if the row was changed or created by someone else meanwhile
+        """
+        key = self._key(path)
+        if expected is None:
+            cursor = self.db.execute(
+                'INSERT OR IGNORE INTO sheets '
+                '(path, version, updated_at, data, file_version, file_sha256) '
+                'VALUES (?, 1, ?, ?, 1, ?)',
+                (key, _now(), data, file_sha256),
+            )
+        else:
+            cursor = self.db.execute(
+                'UPDATE sheets SET version = version + 1, updated_at = ?, data = ?, '
+                'file_version = version + 1, file_sha256 = ? WHERE path = ? AND version = ?',
+                (_now(), data, file_sha256, key, expected.version),
+            )
+        return cursor.rowcount == 1
+
+    def mark_synced(self, path: str, version: int, file_sha256: str) -> bool:
+        """Record that the grade.yml of a row holds the given version, unless the row changed."""
+        cursor = self.db.execute(
+            'UPDATE sheets SET file_version = version, file_sha256 = ? '
+            'WHERE path = ? AND version = ?',
+            (file_sha256, self._key(path), version),
+        )
+        return cursor.rowcount == 1
+
+
+def open_gradebook(path_submissions: str, create: bool = False) -> Gradebook:
+    """Open the gradebook of a submissions tree, exiting if it is missing or unreadable."""
+    path = os.path.join(path_submissions, NAME_GRADEBOOK)
+    if not create and not os.path.isfile(path):
+        con.print_error(
+            f'No gradebook found at {path}\n\n'
+            f'Create one with: staffeli gradebook import {path_submissions}'
+        )
+        sys.exit(1)
+    try:
+        return Gradebook(path, path_submissions)
+    except sqlite3.Error as e:
+        con.print_error(f'Cannot open gradebook: {path}\n{e}\n\nRun with --debug for details')
+        con.print_debug(con.format_exception_debug(e))
+        sys.exit(1)
+
+
+def scan_gradebook(
+    book: Gradebook,
+    tmpl: Assignment,
+    known: dict[str, tuple[int, SheetSummary]] | None = None,
+) -> tuple[list[tuple[str, SheetSummary]], list[str]]:
+    """Summarize the sheets of a gradebook, like scan_sheets does for grade.yml files.
+
+    Args:
+        book: The gradebook
+        tmpl: The template of the assignment
+        known: Summaries by path with the version they were made from, kept
+            across calls so that only changed rows are decoded again
+
+    Returns:
+        (path, summary) for every sheet that decodes and the paths of those
+        that do not, both in path order
+    """
+    summaries = []
+    error_files = []
+    rows = book.rows()
+    for path, row in rows.items():
+        cached = known.get(path) if known is not None else None
+        if cached is not None and cached[0] == row.version:
+            summaries.append((path, cached[1]))
+            continue
+        if (sheet := book.decode(path, row.data)) is None:
+            error_files.append(path)
+            continue
+        summary = SheetSummary.of(sheet, tmpl)
+        summaries.append((path, summary))
+        if known is not None:
+            known[path] = (row.version, summary)
+    if known is not None:
+        for path in known.keys() - rows.keys():
+            del known[path]
+    return summaries, error_files
+
+
+def store_sheets(path_submissions: str, sheets: list[tuple[str, GradingSheet]]) -> None:
+    """Store sheets just written to their grade.yml files in the gradebook, creating it.
+
+    Args:
+        path_submissions: The submissions root
+        sheets: (path of the grade.yml, sheet) of the new sheets
+    """
+    book = open_gradebook(path_submissions, create=True)
+    stored = 0
+    with book.db:
+        for path, sheet in sheets:
+            if (digest := file_digest(path)) is None:
+                continue
+            # A row already there came from an import running meanwhile, which wins
+            stored += book.put(path, encode_sheet(sheet), digest, None)
+    book.close()
+    con.print_info(f'Stored {stored} sheet(s) in {book.path}')
+
+
+def warn_stale(book: Gradebook, path_submissions: str) -> None:
+    """Warn about sheets whose grade.yml changed since the gradebook last saw it."""
+    if not (stale := book.stale_files()):
+        return
+    con.print_warning(f'{len(stale)} grade sheet(s) changed since the gradebook import:')
+    for path in stale:
+        con.print(f'  [warning]![/warning] {path}')
+    con.print('Their grades are shown as last imported.')
+    con.print(f'Import them with: staffeli gradebook import {path_submissions}')
+
+
+def print_skipped(paths: list[str], reason: str) -> None:
+    con.print_warning(f'Skipped {len(paths)} sheet(s) {reason}:')
+    for path in paths:
+        con.print(f'  [warning]![/warning] {path}')
+    con.print('Run again with --force to overwrite them.')
+
+
+def import_sheets(path_submissions: str, force: bool) -> None:
+    paths = find_sheets(path_submissions, follow_links=True)
+    book = open_gradebook(path_submissions, create=True)
+    rows = book.rows()
+
+    # Only parse the files that changed since they were last imported or exported
+    digests = {path: file_digest(path) for path in paths}
+    changed = [
+        path
+        for path in paths
+        if (row := rows.get(path)) is None or digests[path] != row.file_sha256
+    ]
+    sheets, error_files = load_sheets(changed)
+    if error_files:
+        con.print_error(
+            f"""Cannot import - {len(error_files)} grade sheet(s) have errors.
+
+Files with errors:"""
+        )
+        for error_file in error_files:
+            con.print(f'  [error]✗[/error] {error_file}')
+        con.print_error(
+            """
+Please fix the errors above and try again.
+Run with --debug for detailed error information."""
+        )
+        sys.exit(1)
+
+    added = updated = 0
+    conflicts = []
+    with book.db:
+        for path, sheet in sheets:
+            row = rows.get(path)
+            data = encode_sheet(sheet)
+            digest = digests[path]
+            if digest is None:
+                continue
+            if row is not None and row.data == data:
+                # Same sheet, written differently
+                book.mark_synced(path, row.version, digest)
+                continue
+            if row is not None and row.version != row.file_version and not force:
+                conflicts.append(path)
+                continue
+            if not book.put(path, data, digest, row):
+                conflicts.append(path)
+                continue
+            if row is None:
+                added += 1
+            else:
+                updated += 1
+    book.close()
+
+    con.print_success(
+        f'Imported {added} new and {updated} changed sheet(s) into {book.path}, '
+        f'{len(paths) - added - updated - len(conflicts)} unchanged'
+    )
+    if conflicts:
+        print_skipped(conflicts, 'changed in the gradebook since their grade.yml was synced')
+
+
+def export_sheets(path_submissions: str, force: bool) -> None:
+    book = open_gradebook(path_submissions)
+    written = 0
+    conflicts = []
+    error_files = []
+    rows = book.rows()
+    for path, row in rows.items():
+        digest = file_digest(path)
+        if row.file_version == row.version and digest == row.file_sha256:
+            continue
+        if digest is not None and digest != row.file_sha256 and not force:
+            conflicts.append(path)
+            continue
+        if (sheet := book.decode(path, row.data)) is None:
+            error_files.append(path)
+            continue
+        for solution in sheet.solutions:
+            if solution.feedback and '\n' in solution.feedback:
+                solution.feedback = LiteralScalarString(solution.feedback)
+        if not dump_yaml(path, sheet.serialize(), 'grading sheet', emit=emit_sheet_yaml):
+            error_files.append(path)
+            continue
+        if (digest := file_digest(path)) is not None:
+            with book.db:
+                if not book.mark_synced(path, row.version, digest):
+                    conflicts.append(path)
+                    continue
+        written += 1
+    book.close()
+
+    con.print_success(
+        f'Wrote {written} sheet(s) from {book.path}, '
+        f'{len(rows) - written - len(conflicts) - len(error_files)} already up to date'
+    )
+    if conflicts:
+        print_skipped(conflicts, 'whose grade.yml was edited since the last import or export')
+    if error_files:
+        con.print_error(f'Failed to write {len(error_files)} sheet(s):')
+        for error_file in error_files:
+            con.print(f'  [error]✗[/error] {error_file}')
+        sys.exit(1)
+
+
+def add_subparser(subparsers: argparse._SubParsersAction):
+    parser: argparse.ArgumentParser = subparsers.add_parser(
+        name='gradebook', help=f'keep the grading sheets in a single {NAME_GRADEBOOK} file'
+    )
+    actions = parser.add_subparsers(title='actions', dest='action', required=True)
+    for name, description, force in [
+        (
+            'import',
+            f'copy the {NAME_SHEET} files into the gradebook',
+            'import sheets even if they changed in the gradebook since their last sync',
+        ),
+        (
+            'export',
+            f'write the sheets of the gradebook to their {NAME_SHEET} files',
+            f'overwrite {NAME_SHEET} files edited since the last import or export',
+        ),
+    ]:
+        action = actions.add_parser(name=name, help=description)
+        action.add_argument(
+            'path_submissions',
+            type=str,
+            metavar='SUBMISSIONS_PATH',
+            help='path to submissions folder',
+        )
+        action.add_argument('--force', action='store_true', help=force)
+        action.set_defaults(main=main)
+
+
+def main(api_url, api_key, args: argparse.Namespace):
+    if args.action == 'import':
+        import_sheets(args.path_submissions, args.force)
+    else:
+        export_sheets(args.path_submissions, args.force)
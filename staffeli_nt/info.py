@@ -3,12 +3,13 @@ import hashlib
 import math
 import re
 import sys
+from collections.abc import Iterable
 from typing import Any, Dict
 
-from canvasapi import Canvas  # type: ignore[import-untyped]
-
 from . import console as con
-from .util import write_file
+from .cache import MetadataCache
+from .mirror import Mirror, open_mirror
+from .util import paginate, write_file
 
 
 def digest(data):
@@ -178,15 +179,15 @@ def distribute(bags, verbose=True, debug=False):
 #     [handins] is a list of ku-id's
 #               either singular or joined by '-' for group assignments
 # returns: the constructed dictionary
-def get_handins_by_sections(course: Any) -> Dict[str, list[str]]:
-    assignments = sort_by_name(course.get_assignments())
+def get_handins_by_sections(cache: MetadataCache, mirror: Mirror | None) -> Dict[str, list[str]]:
+    assignments = sort_by_name(cache.get_assignments())
     index = con.ask_menu(
         'Select Assignment', [a.name for a in assignments], default=len(assignments) - 1
     )
 
     # Preinitialize the "bags" with course_section_name
     users_and_sections: Dict[str, Any] = {}
-    sections = sorted(list(course.get_sections()), key=lambda x: x.name)
+    sections = sorted(cache.get_sections(), key=lambda x: x.name)
 
     # From the user.enrollments we only have the section_id
     # Normal people prefer reading the section_name
@@ -198,10 +199,19 @@ def get_handins_by_sections(course: Any) -> Dict[str, list[str]]:
 
     assignment = assignments[index]
     handins: Dict[str, Any] = {}
-    submissions = []
-    submissions = assignment.get_submissions()
+    submissions: Iterable[Any]
+    if mirror is not None:
+        mirror.sync(assignment.id, full=cache.refresh)
+        students = mirror.users()
+        submissions = mirror.submissions(assignment.id)
+    else:
+        students = {s.id: s for s in cache.get_students()}
+        submissions = paginate(assignment.get_submissions())
     for submission in submissions:
-        user = course.get_user(submission.user_id, include=['enrollments'])
+        if submission.user_id in students:
+            user = students[submission.user_id]
+        else:
+            user = cache.get_course().get_user(submission.user_id, include=['enrollments'])
 
         if hasattr(submission, 'attachments') and len(submission.attachments) > 0:
             con.print_info(f'User {user.name} handed in something')
@@ -239,32 +249,26 @@ def get_handins_by_sections(course: Any) -> Dict[str, list[str]]:
     return users_and_sections
 
 
-def create_and_write_assignment_distribution(course, fname, verbose=True, debug=False):
-    handins = get_handins_by_sections(course)
+def create_and_write_assignment_distribution(cache, mirror, fname, verbose=True, debug=False):
+    handins = get_handins_by_sections(cache, mirror)
     distributed_handins = distribute(handins, verbose, debug)
     write_ta_list(distributed_handins, fname)
 
 
-def get_section_info(course):
-    sections = sorted(list(course.get_sections()), key=lambda x: x.name)
+def get_section_info(cache):
+    sections = sorted(cache.get_sections(), key=lambda x: x.name)
     index = con.ask_menu('Select Section', [s.name for s in sections])
 
     section = sections[index]
     con.print_info(f'Fetching: {section}')
 
-    students = course.get_users(
-        enrollment_type='student', enrollment_state='active', include=['enrollments']
-    )
+    students = cache.get_students()
     con.print('kuid,name')
     for student in students:
         if student.enrollments[0]['course_section_id'] == section.id:
             con.print(f'{kuid(student.email):>6s},{student.name}')
 
 
-def get_course(api_url, api_key, course_id):
-    return Canvas(api_url, api_key).get_course(course_id)
-
-
 def add_subparser(subparsers: argparse._SubParsersAction):
     parser: argparse.ArgumentParser = subparsers.add_parser(
         name='info', help='fetch infomation related to a course'
@@ -292,20 +296,19 @@ def main(api_url, api_key, args: argparse.Namespace):
     fname = args.get_ass_dist
     ids = args.ids
 
-    canvas = Canvas(api_url, api_key)
+    cache = MetadataCache(api_url, api_key, course_id, refresh=args.refresh)
     try:
-        course = canvas.get_course(course_id)
+        cache.get_course()
     except Exception as e:
         con.print_error(f'Cannot access course: {course_id}\n\nRun with --debug for details')
         con.print_debug(con.format_exception_debug(e))
         sys.exit(1)
 
     if fname is not None:
-        course = get_course(api_url, api_key, course_id)
-        create_and_write_assignment_distribution(course, fname, verbose, debug)
+        mirror = open_mirror(args.mirror, cache)
+        create_and_write_assignment_distribution(cache, mirror, fname, verbose, debug)
     elif ids:
-        course = get_course(api_url, api_key, course_id)
-        get_section_info(course)
+        get_section_info(cache)
     else:
         con.print_error("""Missing required argument for 'info' subcommand.
 
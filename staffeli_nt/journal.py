@@ -0,0 +1,88 @@
+"""Journal of completed upload steps.
+
+Every comment posted and grade set by ``upload --live`` is appended to a JSON
+lines file next to ``meta.yml``, and flushed to disk before the next step
+starts. When an upload is interrupted, the next run skips the steps the
+journal records as done for the same feedback and grade, and only redoes the
+rest. Steps are keyed by the digest of the feedback and by the grade, so a
+changed grading sheet is uploaded again.
+
+The journal only knows what staffeli did. A grade or comment changed or
+deleted in Canvas afterwards is still recorded as done, which is what
+``upload --ignore-journal`` is for.
+"""
+
+import json
+import os
+import threading
+
+from . import console as con
+
+NAME_JOURNAL = 'upload-journal.jsonl'
+
+# Kinds of steps recorded in the journal
+OP_COMMENT = 'comment'
+OP_GRADE = 'grade'
+
+
+class UploadJournal:
+    """Thread-safe, append-only journal of finished upload steps."""
+
+    def __init__(self, path: str, ignore_existing: bool = False):
+        """
+        Args:
+            path: The journal file
+            ignore_existing: Do not skip steps recorded by earlier runs
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._done: set[tuple[int, int, str, str]] = set()
+        if ignore_existing:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self._done.add(
+                            (
+                                entry['assignment_id'],
+                                entry['user_id'],
+                                entry['op'],
+                                entry['value'],
+                            )
+                        )
+                    except (ValueError, KeyError):
+                        # A line cut short by a crash, ignore it
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def done(self, assignment_id: int, user_ids: list[int], op: str, value) -> bool:
+        """Whether the step is recorded as done for every one of the users."""
+        with self._lock:
+            return all(
+                (assignment_id, user_id, op, str(value)) in self._done for user_id in user_ids
+            )
+
+    def record(self, assignment_id: int, user_ids: list[int], op: str, value) -> None:
+        """Record a step as done for the users, and wait for it to reach the disk."""
+        entries = [
+            {'assignment_id': assignment_id, 'user_id': user_id, 'op': op, 'value': str(value)}
+            for user_id in user_ids
+        ]
+        with self._lock:
+            for user_id in user_ids:
+                self._done.add((assignment_id, user_id, op, str(value)))
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                con.print_warning(f'Failed to write upload journal: {self.path}')
+                con.print_debug(con.format_exception_debug(e))
+
+
+def open_journal(path_submissions: str, ignore_existing: bool = False) -> UploadJournal:
+    return UploadJournal(os.path.join(path_submissions, NAME_JOURNAL), ignore_existing)
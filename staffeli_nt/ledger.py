@@ -0,0 +1,87 @@
+"""Ledger of feedback files uploaded to Canvas.
+
+Checking whether feedback was already uploaded used to mean downloading every
+attachment of every comment on a submission. The ledger remembers the sha256
+of each feedback attachment staffeli has seen, keyed by assignment, user and
+attachment id, so that check costs no downloads once an attachment is known.
+It lives next to ``meta.yml`` as an append-only JSON lines file.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any
+
+from . import console as con
+
+NAME_LEDGER = 'feedback-ledger.jsonl'
+
+
+def feedback_digest(feedback: str) -> str:
+    """Return the digest used to compare feedback, ignoring surrounding whitespace."""
+    return hashlib.sha256(feedback.strip().encode('utf-8')).hexdigest()
+
+
+def may_hold_feedback(attachment: dict[str, Any], feedback: str) -> bool:
+    """Cheap pre-filter on attachment metadata before downloading it.
+
+    Feedback is uploaded as ``feedback.txt`` (Canvas may add a suffix such as
+    ``feedback-1.txt``). Feedback is compared ignoring surrounding whitespace,
+    so the file may be any amount larger than the stripped text, but not smaller.
+    """
+    name = attachment.get('display_name') or attachment.get('filename') or ''
+    if not (name.startswith('feedback') and name.endswith('.txt')):
+        return False
+    size = attachment.get('size')
+    return size is None or size >= len(feedback.strip().encode('utf-8'))
+
+
+class FeedbackLedger:
+    """Thread-safe, append-only record of feedback attachment digests."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._digests: dict[tuple[int, int, int], str] = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        key = (entry['assignment_id'], entry['user_id'], entry['attachment_id'])
+                        self._digests[key] = entry['sha256']
+                    except (ValueError, KeyError):
+                        # A line cut short by a crash, ignore it
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def digest_of(self, assignment_id: int, user_id: int, attachment_id: int) -> str | None:
+        with self._lock:
+            return self._digests.get((assignment_id, user_id, attachment_id))
+
+    def record(
+        self, assignment_id: int, user_id: int, attachment: dict[str, Any], digest: str
+    ) -> None:
+        """Remember the digest of an attachment on a user's submission."""
+        entry = {
+            'assignment_id': assignment_id,
+            'user_id': user_id,
+            'attachment_id': attachment['id'],
+            'sha256': digest,
+            'size': attachment.get('size'),
+            'display_name': attachment.get('display_name'),
+        }
+        with self._lock:
+            self._digests[(assignment_id, user_id, attachment['id'])] = digest
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+            except OSError as e:
+                con.print_debug(f'Failed to write feedback ledger: {self.path}')
+                con.print_debug(con.format_exception_debug(e))
+
+
+def open_ledger(path_submissions: str) -> FeedbackLedger:
+    return FeedbackLedger(os.path.join(path_submissions, NAME_LEDGER))
@@ -0,0 +1,318 @@
+"""Local SQLite mirror of a course.
+
+The mirror keeps users, enrollments, sections, assignments and submissions
+(with attachment metadata and comments) in a single SQLite file. After the
+first full sync of an assignment, only submissions that were submitted or
+graded since the previous sync are fetched again, so repeated scans of a whole
+course become local queries.
+
+Submissions are returned as canvasapi Submission objects, so writes such as
+``edit`` and ``upload_comment`` still go to Canvas directly. Changes made that
+way are picked up by the next sync, as grading updates ``graded_at``. A
+comment added without a grade change updates neither timestamp, so only a
+full sync sees it; ``upload --live`` always syncs in full for that reason.
+"""
+
+import json
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+from canvasapi.submission import Submission  # type: ignore[import-untyped]
+from canvasapi.user import User  # type: ignore[import-untyped]
+
+from . import console as con
+from .cache import MetadataCache
+from .util import PER_PAGE, follow_pages
+
+# Overlap between incremental syncs, guards against submissions that were
+# being written on the server while the previous sync ran
+SYNC_OVERLAP = timedelta(minutes=1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    login_id TEXT,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS enrollments (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    course_section_id INTEGER,
+    type TEXT,
+    state TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    assignment_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    workflow_state TEXT,
+    score REAL,
+    submitted_at TEXT,
+    graded_at TEXT,
+    data TEXT NOT NULL,
+    UNIQUE (assignment_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    id INTEGER NOT NULL,
+    submission_id INTEGER NOT NULL,
+    filename TEXT,
+    size INTEGER,
+    url TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (submission_id, id)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER NOT NULL,
+    submission_id INTEGER NOT NULL,
+    author_id INTEGER,
+    created_at TEXT,
+    comment TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (submission_id, id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def server_time(response) -> datetime:
+    """Return the server time of a response, or the local time if it has none."""
+    try:
+        return parsedate_to_datetime(response.headers['Date'])
+    except (KeyError, TypeError, ValueError):
+        return datetime.now(timezone.utc)
+
+
+class Mirror:
+    """SQLite mirror of the course behind a MetadataCache.
+
+    The connection is shared between threads, all access goes through a lock.
+    """
+
+    def __init__(self, path: str, cache: MetadataCache):
+        self.path = path
+        self.cache = cache
+        self.requester = cache.requester
+        self.course_id = cache.course_id
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        with self.db:
+            self.db.execute(
+                "INSERT OR IGNORE INTO sync_state (name, value) VALUES ('course_id', ?)",
+                (str(self.course_id),),
+            )
+            (mirrored,) = self.db.execute(
+                "SELECT value FROM sync_state WHERE name = 'course_id'"
+            ).fetchone()
+        if int(mirrored) != self.course_id:
+            raise ValueError(f'{path} mirrors course {mirrored}, not {self.course_id}')
+
+    def close(self) -> None:
+        with self._lock:
+            self.db.close()
+
+    def sync(self, assignment_id, full: bool = False) -> None:
+        """Bring the mirror up to date for an assignment.
+
+        Args:
+            assignment_id: The assignment whose submissions are synced
+            full: Fetch every submission, not only those changed since the last sync
+        """
+        self._sync_metadata()
+        self._sync_submissions(int(assignment_id), full)
+
+    def _sync_metadata(self) -> None:
+        # Listings without server-side change filters come through the
+        # metadata cache, which takes care of TTLs and revalidation
+        sections = self.cache.sections_data()
+        assignments = self.cache.assignments_data()
+        students = self.cache.students_data()
+
+        with self._lock, self.db:
+            self.db.execute('DELETE FROM sections')
+            self.db.executemany(
+                'INSERT INTO sections (id, name, data) VALUES (?, ?, ?)',
+                [(s['id'], s.get('name'), json.dumps(s)) for s in sections],
+            )
+            self.db.execute('DELETE FROM assignments')
+            self.db.executemany(
+                'INSERT INTO assignments (id, name, updated_at, data) VALUES (?, ?, ?, ?)',
+                [(a['id'], a.get('name'), a.get('updated_at'), json.dumps(a)) for a in assignments],
+            )
+            self.db.execute('DELETE FROM users')
+            self.db.execute('DELETE FROM enrollments')
+            self.db.executemany(
+                'INSERT INTO users (id, login_id, name, data) VALUES (?, ?, ?, ?)',
+                [(u['id'], u.get('login_id'), u.get('name'), json.dumps(u)) for u in students],
+            )
+            self.db.executemany(
+                'INSERT OR REPLACE INTO enrollments '
+                '(id, user_id, course_section_id, type, state, updated_at, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        e['id'],
+                        u['id'],
+                        e.get('course_section_id'),
+                        e.get('type'),
+                        e.get('enrollment_state'),
+                        e.get('updated_at'),
+                        json.dumps(e),
+                    )
+                    for u in students
+                    for e in u.get('enrollments', [])
+                ],
+            )
+
+    def _sync_submissions(self, assignment_id: int, full: bool) -> None:
+        state_key = f'submissions:{assignment_id}'
+        with self._lock:
+            row = self.db.execute(
+                'SELECT value FROM sync_state WHERE name = ?', (state_key,)
+            ).fetchone()
+        since = None if full or row is None else row[0]
+
+        params: list[tuple[str, Any]] = [
+            ('student_ids[]', 'all'),
+            ('assignment_ids[]', assignment_id),
+            ('include[]', 'submission_comments'),
+            ('include[]', 'user'),
+            ('include[]', 'group'),
+        ]
+        # Canvas combines the since filters with AND, so ask for each separately
+        if since is None:
+            queries = [params]
+        else:
+            queries = [params + [('submitted_since', since)], params + [('graded_since', since)]]
+
+        started = None
+        submissions: dict[int, dict[str, Any]] = {}
+        for query in queries:
+            response = self.requester.request(
+                'GET',
+                f'courses/{self.course_id}/students/submissions',
+                _kwargs=query + [('per_page', PER_PAGE)],
+            )
+            if started is None:
+                started = server_time(response)
+            for s in response.json():
+                submissions[s['id']] = s
+            for s in follow_pages(self.requester, response, lambda page: page.json()):
+                submissions[s['id']] = s
+
+        con.print_debug(
+            f'Mirror synced {len(submissions)} submission(s) for assignment {assignment_id}'
+            + (f' changed since {since}' if since else '')
+        )
+
+        with self._lock, self.db:
+            for s in submissions.values():
+                self._store_submission(s)
+            assert started is not None
+            self.db.execute(
+                'INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)',
+                (state_key, (started - SYNC_OVERLAP).isoformat()),
+            )
+
+    def _store_submission(self, s: dict[str, Any]) -> None:
+        self.db.execute(
+            'INSERT OR REPLACE INTO submissions '
+            '(id, assignment_id, user_id, workflow_state, score, submitted_at, graded_at, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                s['id'],
+                s['assignment_id'],
+                s['user_id'],
+                s.get('workflow_state'),
+                s.get('score'),
+                s.get('submitted_at'),
+                s.get('graded_at'),
+                json.dumps(s),
+            ),
+        )
+        self.db.execute('DELETE FROM attachments WHERE submission_id = ?', (s['id'],))
+        self.db.executemany(
+            'INSERT INTO attachments (id, submission_id, filename, size, url, data) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (a['id'], s['id'], a.get('filename'), a.get('size'), a.get('url'), json.dumps(a))
+                for a in s.get('attachments') or []
+            ],
+        )
+        self.db.execute('DELETE FROM comments WHERE submission_id = ?', (s['id'],))
+        self.db.executemany(
+            'INSERT INTO comments (id, submission_id, author_id, created_at, comment, data) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (
+                    c['id'],
+                    s['id'],
+                    c.get('author_id'),
+                    c.get('created_at'),
+                    c.get('comment'),
+                    json.dumps(c),
+                )
+                for c in s.get('submission_comments') or []
+            ],
+        )
+
+    def _submission(self, data: str) -> Submission:
+        return Submission(self.requester, {**json.loads(data), 'course_id': self.course_id})
+
+    def submission(self, assignment_id, user_id) -> Submission | None:
+        """Return the mirrored submission of a user, or None if it is not mirrored."""
+        with self._lock:
+            row = self.db.execute(
+                'SELECT data FROM submissions WHERE assignment_id = ? AND user_id = ?',
+                (int(assignment_id), int(user_id)),
+            ).fetchone()
+        return self._submission(row[0]) if row is not None else None
+
+    def submissions(self, assignment_id, user_ids=None) -> list[Submission]:
+        """Return the mirrored submissions of an assignment, optionally for some users only."""
+        with self._lock:
+            rows = self.db.execute(
+                'SELECT user_id, data FROM submissions WHERE assignment_id = ? ORDER BY id',
+                (int(assignment_id),),
+            ).fetchall()
+        wanted = None if user_ids is None else set(user_ids)
+        return [self._submission(data) for uid, data in rows if wanted is None or uid in wanted]
+
+    def users(self) -> dict[int, User]:
+        """Return the mirrored active students, including enrollments, by user id."""
+        with self._lock:
+            rows = self.db.execute('SELECT id, data FROM users').fetchall()
+        return {uid: User(self.requester, json.loads(data)) for uid, data in rows}
+
+
+def open_mirror(path: str | None, cache: MetadataCache) -> Mirror | None:
+    """Open the mirror at path, or return None when no mirror is used."""
+    if path is None:
+        return None
+    try:
+        return Mirror(path, cache)
+    except (sqlite3.Error, ValueError) as e:
+        con.print_error(f'Cannot open course mirror: {path}\n{e}\n\nRun with --debug for details')
+        con.print_debug(con.format_exception_debug(e))
+        sys.exit(1)
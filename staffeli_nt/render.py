@@ -0,0 +1,124 @@
+"""Rendering of the feedback of every grading sheet, once per upload.
+
+``upload`` needs the feedback of a sheet for the upload itself, for the
+``--step`` preview, for ``--delta``, ``--write-local`` and
+``--export-archive``. The rendering stage renders every graded sheet up
+front, and ``format_md`` remembers the text on the sheet, like ``get_grade``
+does for the grade, so all of them share one rendering.
+
+Each rendering is identified by a content hash of the sheet and the
+template. With ``upload --feedback-cache``, renderings are also kept in
+``feedback-cache.json`` in the submissions root, and sheets whose hash is
+unchanged are not rendered again on the next run. Changing the template
+changes every hash.
+"""
+
+import hashlib
+import json
+import os
+
+from . import console as con
+from .gradebook import encode_sheet
+from .scan_index import template_digest
+from .vas import Assignment, GradingSheet
+
+NAME_FEEDBACK_CACHE = 'feedback-cache.json'
+CACHE_VERSION = 1
+
+
+class FeedbackCache:
+    """Rendered feedback keyed by the content hash of sheet and template."""
+
+    def __init__(self, path: str, digest: str):
+        """
+        Args:
+            path: The cache file
+            digest: Digest of the template the sheets are rendered with
+        """
+        self.path = path
+        self.digest = digest
+        self._entries: dict[str, str] = {}
+        self._seen: set[str] = set()
+        self._dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == CACHE_VERSION:
+                self._entries = data['feedback']
+            else:
+                self._dirty = True
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            con.print_debug(f'Ignoring unreadable feedback cache: {path}')
+            con.print_debug(con.format_exception_debug(e))
+            self._dirty = True
+
+    def content_key(self, sheet: GradingSheet) -> str:
+        """Return a hash of everything the feedback of a sheet is rendered from."""
+        h = hashlib.sha256(self.digest.encode('ascii'))
+        h.update(encode_sheet(sheet).encode('utf-8'))
+        return h.hexdigest()
+
+    def lookup(self, key: str) -> str | None:
+        self._seen.add(key)
+        return self._entries.get(key)
+
+    def store(self, key: str, feedback: str) -> None:
+        self._seen.add(key)
+        self._entries[key] = feedback
+        self._dirty = True
+
+    def save(self) -> None:
+        """Write the cache, dropping renderings not looked up or stored since it was opened."""
+        entries = {key: text for key, text in self._entries.items() if key in self._seen}
+        if not self._dirty and len(entries) == len(self._entries):
+            return
+        data = {'version': CACHE_VERSION, 'feedback': entries}
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            con.print_debug(f'Failed to write feedback cache: {self.path}')
+            con.print_debug(con.format_exception_debug(e))
+
+
+def open_feedback_cache(path_submissions: str, path_template: str) -> FeedbackCache:
+    return FeedbackCache(
+        os.path.join(path_submissions, NAME_FEEDBACK_CACHE), template_digest(path_template)
+    )
+
+
+def render_feedback(
+    sheets: list[tuple[str, GradingSheet]],
+    tmpl: Assignment,
+    cache: FeedbackCache | None = None,
+) -> None:
+    """Render the feedback of every graded sheet, so that later calls of format_md reuse it.
+
+    Ungraded sheets are left to format_md, which warns about them when they
+    are used. Rendering takes a fraction of a millisecond per sheet, less
+    than sending the sheet to another process would, so it runs in this one.
+
+    Args:
+        sheets: (path, sheet) of the sheets to render
+        tmpl: The template of the assignment
+        cache: Renderings of earlier runs to reuse, updated with the new ones
+    """
+    graded = [sheet for _, sheet in sheets if sheet.is_graded(tmpl)]
+    reused = 0
+    for sheet in graded:
+        if cache is None:
+            tmpl.format_md(sheet)
+            continue
+        key = cache.content_key(sheet)
+        if (feedback := cache.lookup(key)) is not None:
+            sheet.remember_feedback(tmpl, feedback)
+            reused += 1
+        else:
+            cache.store(key, tmpl.format_md(sheet))
+    if cache is not None:
+        cache.save()
+        con.print_debug(f'Rendered feedback for {len(graded) - reused} sheet(s), reused {reused}')
@@ -1,10 +1,19 @@
 import argparse
-import os
+import collections
+import time
+
+from rich.live import Live
+from rich.table import Table
 
 from .console import console, print_error, print_success, print_warning
-from .vas import GradingSheet, load_gradingsheet, load_template_or_exit
+from .gradebook import NAME_GRADEBOOK, Gradebook, open_gradebook, scan_gradebook, warn_stale
+from .scan_index import SheetSummary, Stamp, open_index, scan_sheets, stat_sheet
+from .sheets import find_sheets, ta_directory
+from .util import load_and_parse_yaml
+from .vas import Assignment, load_template_or_exit, parse_template
 
-NAME_SHEET = 'grade.yml'
+WATCH_INTERVAL = 2.0  # Seconds between polls of the submissions tree with --watch
+RATE_WINDOW = 15 * 60  # Seconds of history behind the grading rate
 
 
 def add_subparser(subparsers: argparse._SubParsersAction):
@@ -17,29 +26,169 @@ def add_subparser(subparsers: argparse._SubParsersAction):
     parser.add_argument(
         'path_submissions', type=str, metavar='SUBMISSIONS_PATH', help='path to submissions folder'
     )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='keep scanning and show a live summary per TA directory, until Ctrl-C',
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=WATCH_INTERVAL,
+        metavar='SECONDS',
+        help=f'with --watch, seconds between scans (default: {WATCH_INTERVAL:g})',
+    )
+    parser.add_argument(
+        '--gradebook',
+        action='store_true',
+        help=f'read the sheets from {NAME_GRADEBOOK} instead of the grade.yml files',
+    )
     parser.set_defaults(main=main)
 
 
+class GradingRate:
+    """Sheets graded per hour, per TA directory, over a rolling window."""
+
+    def __init__(self, window: float = RATE_WINDOW):
+        self.window = window
+        self.samples: collections.deque[tuple[float, dict[str, int]]] = collections.deque()
+
+    def add(self, now: float, done: dict[str, int]) -> None:
+        self.samples.append((now, done))
+        # Keep one sample older than the window, to measure across all of it
+        while len(self.samples) > 2 and self.samples[1][0] <= now - self.window:
+            self.samples.popleft()
+
+    def per_hour(self, group: str | None = None) -> float | None:
+        """Return the rate of a directory, or of all of them, or None without history."""
+        (first, done_first), (last, done_last) = self.samples[0], self.samples[-1]
+        if last - first < 1:
+            return None
+
+        def count(done: dict[str, int]) -> int:
+            return sum(done.values()) if group is None else done.get(group, 0)
+
+        return max(0.0, (count(done_last) - count(done_first)) * 3600 / (last - first))
+
+
+def format_rate(rate: float | None) -> str:
+    return '-' if rate is None else f'{rate:.1f}/h'
+
+
+def render_dashboard(
+    path_submissions: str,
+    sheets: list[tuple[str, SheetSummary]],
+    error_files: list[str],
+    rate: GradingRate,
+) -> Table:
+    done: collections.Counter[str] = collections.Counter()
+    missing: collections.Counter[str] = collections.Counter()
+    errors: collections.Counter[str] = collections.Counter()
+    for path, summary in sheets:
+        (done if summary.graded else missing)[ta_directory(path_submissions, path)] += 1
+    for path in error_files:
+        errors[ta_directory(path_submissions, path)] += 1
+
+    table = Table(
+        title=f'Grading in {path_submissions}',
+        caption=f'Updated {time.strftime("%H:%M:%S")}, Ctrl-C to stop',
+    )
+    table.add_column('Directory')
+    table.add_column('Done', justify='right', style='success')
+    table.add_column('Missing', justify='right', style='error')
+    table.add_column('Errors', justify='right', style='warning')
+    table.add_column('Rate', justify='right')
+    for group in sorted(done.keys() | missing.keys() | errors.keys()):
+        table.add_row(
+            group,
+            str(done[group]),
+            str(missing[group]),
+            str(errors[group] or ''),
+            format_rate(rate.per_hour(group)),
+        )
+    table.add_section()
+    table.add_row(
+        'Total',
+        str(done.total()),
+        str(missing.total()),
+        str(errors.total() or ''),
+        format_rate(rate.per_hour()),
+    )
+    return table
+
+
+def watch(
+    path_submissions: str,
+    path_template: str,
+    tmpl: Assignment,
+    interval: float,
+    book: Gradebook | None = None,
+) -> None:
+    """Scan the submissions tree every interval seconds and show a live summary.
+
+    Each scan stats the sheets and only parses those that changed, so an idle
+    tree costs one stat per sheet per interval. With a gradebook, each scan
+    is one query and only rows whose version changed are decoded. The
+    template is reloaded when it changes.
+    """
+    index = open_index(path_submissions, path_template)
+    template_stamp = stat_sheet(path_template)
+    failed: dict[str, Stamp] = {}
+    known: dict[str, tuple[int, SheetSummary]] = {}
+    rate = GradingRate()
+
+    with Live(console=console, auto_refresh=False) as live:
+        try:
+            while True:
+                if (stamp := stat_sheet(path_template)) != template_stamp:
+                    template_stamp = stamp
+                    reloaded = load_and_parse_yaml(path_template, parse_template, 'template')
+                    if reloaded is not None:
+                        tmpl = reloaded
+                        index = open_index(path_submissions, path_template)
+                        failed.clear()
+                        known.clear()
+
+                if book is not None:
+                    sheets, error_files = scan_gradebook(book, tmpl, known)
+                else:
+                    sheets, error_files = scan_sheets(
+                        find_sheets(path_submissions), tmpl, index, failed
+                    )
+                done = collections.Counter(
+                    ta_directory(path_submissions, path)
+                    for path, summary in sheets
+                    if summary.graded
+                )
+                rate.add(time.monotonic(), done)
+                live.update(
+                    render_dashboard(path_submissions, sheets, error_files, rate), refresh=True
+                )
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
 def main(api_url, api_key, args: argparse.Namespace):
     path_template = args.path_template
     path_submissions = args.path_submissions
 
-    sheets: list[tuple[str, GradingSheet]] = []
-    error_files: list[str] = []
-
     tmpl = load_template_or_exit(path_template)
 
-    # fetch every grading sheet
-    for root, dirs, files in os.walk(path_submissions):
-        for name in files:
-            if name != NAME_SHEET:
-                continue
+    book = open_gradebook(path_submissions) if args.gradebook else None
+    if book is not None:
+        warn_stale(book, path_submissions)
+
+    if args.watch:
+        watch(path_submissions, path_template, tmpl, max(0.1, args.interval), book)
+        return
 
-            path = os.path.join(root, name)
-            if (result := load_gradingsheet(path)) is not None:
-                sheets.append(result)
-            else:
-                error_files.append(path)
+    if book is not None:
+        sheets, error_files = scan_gradebook(book, tmpl)
+    else:
+        # summarize every grading sheet, parsing only those changed since the last scan
+        index = open_index(path_submissions, path_template)
+        sheets, error_files = scan_sheets(find_sheets(path_submissions), tmpl, index)
 
     # Report any files that failed to parse
     if error_files:
@@ -61,13 +210,13 @@ Run with --debug for detailed error information."""
     graded = True
     missing = 0
     done = 0
-    for path, sheet in sheets:
-        if not sheet.is_graded(tmpl):
+    for path, summary in sheets:
+        if not summary.graded:
             console.print(f'[error]■[/error] {path} is not graded')
             graded = False
             missing += 1
         else:
-            total = sheet.get_grade(tmpl)
+            total = summary.total
             tp = tmpl.total_points
             console.print(f'[success]■[/success] {total}/{tp} points for {path}')
             done += 1
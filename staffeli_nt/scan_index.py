@@ -0,0 +1,228 @@
+"""Index of grading sheet summaries, for repeated scans of a submissions tree.
+
+TAs run ``scan`` many times while grading, and most sheets have not changed
+since the previous run. The index lives in the submissions root and maps each
+sheet to the size and modification time it had when it was last parsed,
+together with what ``scan`` and ``stats`` need from it: whether it is graded,
+its total, its students and the grade and bonus of each task. Sheets whose
+stat still matches are not parsed again. The whole index is dropped when the
+template changes, since the summaries depend on it.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any
+
+from . import console as con
+from .sheets import load_sheets, relative_path
+from .vas import Assignment, GradingSheet
+
+NAME_INDEX = 'scan-index.json'
+INDEX_VERSION = 3
+
+# Sheets modified this recently are not indexed, as a later change within the
+# timestamp granularity of the file system would leave their stat unchanged
+RACY_WINDOW_NS = 2_000_000_000
+
+Stamp = tuple[int, int]  # (st_mtime_ns, st_size)
+
+
+class SheetSummary:
+    """What scan and stats report about a grading sheet."""
+
+    def __init__(self, graded: bool, total, students: list[int], tasks: list, bonus: list):
+        """
+        Args:
+            graded: Whether every task of the sheet is graded
+            total: The grade of the sheet, None if it is not graded
+            students: The ids of the students the sheet is for
+            tasks: Grade without bonus per task of the template, None if the
+                task is not graded or not in the sheet
+            bonus: Bonus per task of the template
+        """
+        self.graded = graded
+        self.total = total
+        self.students = students
+        self.tasks = tasks
+        self.bonus = bonus
+
+    @classmethod
+    def of(cls, sheet: GradingSheet, tmpl: Assignment) -> 'SheetSummary':
+        total = sheet.get_grade(tmpl)
+        solutions = {solution.name: solution for solution in sheet.solutions}
+        tasks = []
+        bonus = []
+        for task in tmpl.tasks:
+            solution = solutions.get(task.name)
+            tasks.append(solution.get_grade(task, with_bonus=False) if solution else None)
+            # get_grade ignores the bonus of tasks without points, so the totals do too
+            if solution and solution.points is not None:
+                bonus.append(solution.bonus or 0)
+            else:
+                bonus.append(0)
+        return cls(
+            total is not None, total, [student.id for student in sheet.students], tasks, bonus
+        )
+
+    def serialize(self) -> dict[str, Any]:
+        return {
+            'graded': self.graded,
+            'total': self.total,
+            'students': self.students,
+            'tasks': self.tasks,
+            'bonus': self.bonus,
+        }
+
+
+def stat_sheet(path: str) -> Stamp | None:
+    """Return the stamp of a sheet, or None if it cannot be read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def template_digest(path_template: str) -> str:
+    with open(path_template, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ScanIndex:
+    """Sheet summaries keyed by path relative to the submissions root."""
+
+    def __init__(self, path: str, path_submissions: str, digest: str):
+        """
+        Args:
+            path: The index file
+            path_submissions: The root the sheet paths are relative to
+            digest: Digest of the template the summaries were computed with
+        """
+        self.path = path
+        self.root = path_submissions
+        self.digest = digest
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._seen: set[str] = set()
+        self._dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION and data.get('template') == digest:
+                self._entries = data['sheets']
+            else:
+                self._dirty = True
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            con.print_debug(f'Ignoring unreadable scan index: {path}')
+            con.print_debug(con.format_exception_debug(e))
+            self._dirty = True
+
+    def _key(self, path: str) -> str:
+        return relative_path(self.root, path)
+
+    def lookup(self, path: str, stamp: Stamp) -> SheetSummary | None:
+        """Return the summary of a sheet if it has not changed since it was indexed."""
+        key = self._key(path)
+        self._seen.add(key)
+        entry = self._entries.get(key)
+        if entry is None or (entry['mtime_ns'], entry['size']) != stamp:
+            return None
+        return SheetSummary(
+            entry['graded'], entry['total'], entry['students'], entry['tasks'], entry['bonus']
+        )
+
+    def store(self, path: str, stamp: Stamp, summary: SheetSummary) -> None:
+        """Index the summary of a sheet, parsed when it had the given stamp."""
+        key = self._key(path)
+        self._seen.add(key)
+        if time.time_ns() - stamp[0] < RACY_WINDOW_NS:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+            return
+        self._entries[key] = {'mtime_ns': stamp[0], 'size': stamp[1], **summary.serialize()}
+        self._dirty = True
+
+    def save(self) -> None:
+        """Write the index, dropping sheets not looked up or stored since the last save."""
+        entries = {key: entry for key, entry in self._entries.items() if key in self._seen}
+        dirty = self._dirty or len(entries) != len(self._entries)
+        self._entries = entries
+        self._seen = set()
+        self._dirty = False
+        if not dirty:
+            return
+        data = {'version': INDEX_VERSION, 'template': self.digest, 'sheets': entries}
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            con.print_debug(f'Failed to write scan index: {self.path}')
+            con.print_debug(con.format_exception_debug(e))
+
+
+def open_index(path_submissions: str, path_template: str) -> ScanIndex:
+    return ScanIndex(
+        os.path.join(path_submissions, NAME_INDEX),
+        path_submissions,
+        template_digest(path_template),
+    )
+
+
+def scan_sheets(
+    paths: list[str],
+    tmpl: Assignment,
+    index: ScanIndex,
+    failed: dict[str, Stamp] | None = None,
+) -> tuple[list[tuple[str, SheetSummary]], list[str]]:
+    """Summarize grading sheets, parsing only those that changed since they were indexed.
+
+    Args:
+        paths: The grading sheets to summarize
+        tmpl: The template of the assignment
+        index: The index to consult and update
+        failed: Stamps of sheets that did not parse, kept across calls so
+            that they are only parsed again once they change
+
+    Returns:
+        (path, summary) for every sheet that parsed and the paths of those
+        that did not, both in the order of paths
+    """
+    summaries: dict[str, SheetSummary] = {}
+    stamps: dict[str, Stamp] = {}
+    stale = []
+    still_failed = set()
+    for path in paths:
+        stamp = stat_sheet(path)
+        summary = index.lookup(path, stamp) if stamp is not None else None
+        if summary is not None:
+            summaries[path] = summary
+        elif failed is not None and stamp is not None and failed.get(path) == stamp:
+            still_failed.add(path)
+        else:
+            stale.append(path)
+            if stamp is not None:
+                stamps[path] = stamp
+
+    sheets, error_files = load_sheets(stale)
+    for path, sheet in sheets:
+        summaries[path] = SheetSummary.of(sheet, tmpl)
+        if path in stamps:
+            index.store(path, stamps[path], summaries[path])
+    index.save()
+
+    if failed is not None:
+        for path in list(failed):
+            if path not in still_failed:
+                del failed[path]
+        for path in error_files:
+            if path in stamps:
+                failed[path] = stamps[path]
+        failing = still_failed.union(error_files)
+        error_files = [path for path in paths if path in failing]
+
+    return [(path, summaries[path]) for path in paths if path in summaries], error_files
@@ -0,0 +1,203 @@
+"""Discovery and loading of the grading sheets in a submissions tree.
+
+Sheets live in the submission directories download creates, one level below
+the submissions root, or a few levels down if TAs group submissions into
+directories of their own. Discovery never looks inside a submission
+directory, nor inside the code students hand in, so it costs one directory
+listing per submission whatever the students shipped. download also records
+where it put every sheet, which saves even those listings.
+
+Parsing a sheet is CPU-bound, so large trees are parsed in chunks on a
+process pool. Sheets, parse errors and the messages explaining them come
+back in the order the sheets were found, as if parsed one by one.
+"""
+
+import concurrent.futures
+import json
+import os
+import sys
+
+from . import console as con
+from .vas import GradingSheet, load_gradingsheet
+
+NAME_SHEET = 'grade.yml'
+NAME_LOCATIONS = 'sheet-locations.json'
+SHEETS_PER_CHUNK = 32  # Sheets parsed per task on the process pool
+MAX_SHEET_DEPTH = 3  # Directory levels below the submissions root that may hold sheets
+
+# Directories that never hold grading sheets
+PRUNE_DIRS = frozenset(
+    [
+        'unpacked',
+        'node_modules',
+        '__MACOSX',
+        '__pycache__',
+        'venv',
+        'build',
+        'dist',
+        'dist-newstyle',
+        'target',
+        '_build',
+    ]
+)
+
+
+def _pruned(name: str) -> bool:
+    return name in PRUNE_DIRS or name.startswith('.') or name.endswith('_unpacked')
+
+
+def relative_path(path_submissions: str, path: str) -> str:
+    """Return the path of a file below the submissions root, relative to the root."""
+    prefix = os.path.join(path_submissions, '')
+    if path.startswith(prefix):
+        return path[len(prefix) :]
+    return os.path.relpath(path, path_submissions)
+
+
+def ta_directory(path_submissions: str, path: str) -> str:
+    """Return the directory grouping a sheet's submission, '.' for the root itself."""
+    parts = relative_path(path_submissions, path).split(os.sep)
+    return os.path.join(*parts[:-2]) if len(parts) > 2 else '.'
+
+
+def write_locations(path_submissions: str, paths: list[str]) -> None:
+    """Record where the grading sheets of a submissions tree are."""
+    path = os.path.join(path_submissions, NAME_LOCATIONS)
+    locations = sorted(relative_path(path_submissions, p) for p in paths)
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'sheets': locations}, f, indent=2)
+    except OSError as e:
+        con.print_warning(f'Failed to write sheet locations: {path}')
+        con.print_debug(con.format_exception_debug(e))
+
+
+def read_locations(path_submissions: str) -> list[str]:
+    """Return the recorded sheets that still exist, or nothing if none are recorded."""
+    path = os.path.join(path_submissions, NAME_LOCATIONS)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            locations = json.load(f)['sheets']
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        con.print_debug(f'Ignoring unreadable sheet locations: {path}')
+        con.print_debug(con.format_exception_debug(e))
+        return []
+    paths = (os.path.join(path_submissions, location) for location in locations)
+    return [p for p in paths if os.path.isfile(p)]
+
+
+def find_sheets(path_submissions: str, follow_links: bool = False) -> list[str]:
+    """Return the paths of every grading sheet below path_submissions, sorted.
+
+    Sheets recorded by download are taken as found. The rest of the tree is
+    searched down to MAX_SHEET_DEPTH, skipping the directories in PRUNE_DIRS,
+    hidden directories and everything below a directory holding a sheet,
+    since sheets are never nested inside a submission. The root itself is
+    always searched.
+
+    Args:
+        path_submissions: The submissions root
+        follow_links: Descend into symbolic links to directories. Each
+            directory is visited once, so links cannot make the search loop.
+    """
+    found = []
+    visited: set[tuple[int, int]] = set()
+
+    def first_visit(directory: str) -> bool:
+        try:
+            st = os.stat(directory)
+        except OSError:
+            return False
+        if (st.st_dev, st.st_ino) in visited:
+            return False
+        visited.add((st.st_dev, st.st_ino))
+        return True
+
+    root = os.path.normpath(path_submissions)
+    for path in read_locations(path_submissions):
+        directory = os.path.dirname(path)
+        # The root is searched below even when it holds a sheet itself
+        if os.path.normpath(directory) == root or first_visit(directory):
+            found.append(path)
+
+    def visit(directory: str, depth: int) -> None:
+        if not first_visit(directory):
+            return
+
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.name == NAME_SHEET and entry.is_file():
+                            found.append(entry.path)
+                            # A stray sheet in the root, such as a copied template
+                            # sheet, must not hide the submissions below it
+                            if depth > 0:
+                                return
+                        if entry.is_dir(follow_symlinks=follow_links) and not _pruned(entry.name):
+                            subdirs.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            con.print_debug(f'Cannot list directory: {directory}')
+            con.print_debug(con.format_exception_debug(e))
+            return
+
+        if depth < MAX_SHEET_DEPTH:
+            for subdir in subdirs:
+                visit(subdir, depth + 1)
+
+    visit(path_submissions, 0)
+    return sorted(set(found))
+
+
+def _load_chunk(paths: list[str], debug: bool) -> list[tuple[str, GradingSheet | None, str]]:
+    # Runs in a worker process, which captures what it would have printed
+    con.set_debug_mode(debug)
+    results = []
+    for path in paths:
+        with con.console.capture() as capture:
+            result = load_gradingsheet(path)
+        results.append((path, result[1] if result is not None else None, capture.get()))
+    return results
+
+
+def load_sheets(
+    paths: list[str], workers: int | None = None
+) -> tuple[list[tuple[str, GradingSheet]], list[str]]:
+    """Parse grading sheets, on a process pool when there are enough of them.
+
+    Args:
+        paths: The grading sheets to parse
+        workers: Number of processes, by default one per CPU
+
+    Returns:
+        (path, sheet) for every sheet that parsed and the paths of those that
+        did not, both in the order of paths
+    """
+    sheets: list[tuple[str, GradingSheet]] = []
+    error_files: list[str] = []
+
+    if len(paths) <= SHEETS_PER_CHUNK or workers == 1:
+        for path in paths:
+            if (result := load_gradingsheet(path)) is not None:
+                sheets.append(result)
+            else:
+                error_files.append(path)
+        return sheets, error_files
+
+    chunks = [paths[i : i + SHEETS_PER_CHUNK] for i in range(0, len(paths), SHEETS_PER_CHUNK)]
+    debug = con.is_debug_mode()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_load_chunk, chunks, [debug] * len(chunks)):
+            for path, sheet, output in results:
+                if output:
+                    sys.stdout.write(output)
+                if sheet is not None:
+                    sheets.append((path, sheet))
+                else:
+                    error_files.append(path)
+    return sheets, error_files
@@ -0,0 +1,207 @@
+import argparse
+import math
+import sys
+
+from rich.table import Table
+
+from . import console as con
+from .gradebook import NAME_GRADEBOOK, open_gradebook, scan_gradebook, warn_stale
+from .scan_index import open_index, scan_sheets
+from .sheets import find_sheets
+from .vas import load_template_or_exit
+
+OUTLIERS_SHOWN = 10
+HISTOGRAM_BARS = ' ▁▂▃▄▅▆▇█'
+
+
+def add_subparser(subparsers: argparse._SubParsersAction):
+    parser: argparse.ArgumentParser = subparsers.add_parser(
+        name='stats', help='show statistics of the grades (needs NumPy)'
+    )
+    parser.add_argument(
+        'path_template', type=str, metavar='TEMPLATE_PATH', help='path to the YAML template'
+    )
+    parser.add_argument(
+        'path_submissions', type=str, metavar='SUBMISSIONS_PATH', help='path to submissions folder'
+    )
+    parser.add_argument(
+        '--csv', type=str, metavar='PATH', help='write the grades per student and task to PATH'
+    )
+    parser.add_argument(
+        '--npz', type=str, metavar='PATH', help='write the grade arrays to a NumPy archive at PATH'
+    )
+    parser.add_argument(
+        '--gradebook',
+        action='store_true',
+        help=f'read the sheets from {NAME_GRADEBOOK} instead of the grade.yml files',
+    )
+    parser.set_defaults(main=main)
+
+
+def fmt(value, spec: str = '.2f') -> str:
+    return '-' if value != value else format(value, spec)  # NaN is not equal to itself
+
+
+def percent(value) -> str:
+    return fmt(100 * value, '.0f') + ('%' if value == value else '')
+
+
+def sparkline(counts) -> str:
+    """Draw a histogram as a line of block characters."""
+    top = max(counts)
+    if top == 0:
+        return ''
+    return ''.join(HISTOGRAM_BARS[math.ceil(n / top * (len(HISTOGRAM_BARS) - 1))] for n in counts)
+
+
+def print_tasks(matrix, tmpl) -> None:
+    stats = matrix.task_stats()
+    histograms, bins = matrix.histograms()
+    table = Table(title='Tasks')
+    table.add_column('Task')
+    table.add_column('Points', justify='right')
+    table.add_column('Graded', justify='right')
+    table.add_column('Mean', justify='right')
+    table.add_column('Std', justify='right')
+    table.add_column('Quartiles', justify='right')
+    table.add_column('Full', justify='right')
+    table.add_column('Zero', justify='right')
+    table.add_column('Distribution')
+    for i, task in enumerate(tmpl.tasks):
+        table.add_row(
+            task.name,
+            fmt(matrix.max_points[i], 'g'),
+            str(stats['count'][i]),
+            fmt(stats['mean'][i]),
+            fmt(stats['std'][i]),
+            ' / '.join(fmt(stats[q][i], 'g') for q in ('q1', 'median', 'q3')),
+            percent(stats['full'][i]),
+            percent(stats['zero'][i]),
+            sparkline(histograms[i][: bins[i]]),
+        )
+    con.print(table)
+
+
+def print_totals(matrix, tmpl) -> None:
+    totals = matrix.total_stats()
+    students = len(matrix.students)
+    con.print(
+        f'\n[info]Students:[/info] {students}, '
+        f'{totals["count"]} graded in full, {students - totals["count"]} not'
+    )
+    if totals['count']:
+        con.print(
+            f'[info]Total points:[/info] mean {fmt(totals["mean"])}, '
+            f'median {fmt(totals["median"], "g")}, '
+            f'min {fmt(totals["min"], "g")}, max {fmt(totals["max"], "g")} '
+            f'of {tmpl.total_points}'
+        )
+    passed = matrix.passed()
+    if passed is not None and len(passed):
+        con.print(
+            f'[info]Pass rate:[/info] {percent(passed.mean())} '
+            f'({passed.sum()} of {len(passed)} with at least {tmpl.passing_points} points)'
+        )
+
+
+def print_outliers(matrix) -> None:
+    rows, z = matrix.outliers()
+    if not len(rows):
+        return
+    totals = matrix.totals()
+    table = Table(title=f'Outliers ({len(rows)})')
+    table.add_column('Student', justify='right')
+    table.add_column('Sheet')
+    table.add_column('Total', justify='right')
+    table.add_column('z', justify='right')
+    for row, score in zip(rows[:OUTLIERS_SHOWN], z[:OUTLIERS_SHOWN]):
+        table.add_row(
+            str(matrix.students[row]), matrix.sheets[row], fmt(totals[row], 'g'), fmt(score, '+.1f')
+        )
+    con.print()
+    con.print(table)
+
+
+def print_graders(matrix) -> None:
+    names, stats = matrix.grader_stats()
+    if len(names) < 2:
+        return
+    table = Table(title='TA directories')
+    table.add_column('Directory')
+    table.add_column('Students', justify='right')
+    table.add_column('Graded', justify='right')
+    table.add_column('Mean total', justify='right')
+    if 'pass_rate' in stats:
+        table.add_column('Pass rate', justify='right')
+    table.add_column('Largest task deviation')
+    for i, name in enumerate(names):
+        deviation = stats['worst_deviation'][i]
+        task = matrix.tasks[stats['worst_task'][i]]
+        row = [
+            name,
+            fmt(stats['students'][i], 'g'),
+            fmt(stats['complete'][i], 'g'),
+            fmt(stats['mean'][i]),
+        ]
+        if 'pass_rate' in stats:
+            row.append(percent(stats['pass_rate'][i]))
+        row.append('-' if deviation != deviation else f'{task} {deviation:+.2f}')
+        table.add_row(*row)
+    con.print()
+    con.print(table)
+
+
+def main(api_url, api_key, args: argparse.Namespace):
+    path_template = args.path_template
+    path_submissions = args.path_submissions
+
+    try:
+        from .grade_matrix import GradeMatrix
+    except ModuleNotFoundError as e:
+        if e.name != 'numpy':
+            raise
+        con.print_error(
+            'staffeli stats needs NumPy, which is not installed.\n\n'
+            'Install staffeli_nt with the stats extra, e.g.\n'
+            '  uv tool install ".\\[stats]"   or   pip install -e ".\\[stats]"'
+        )
+        sys.exit(1)
+
+    tmpl = load_template_or_exit(path_template)
+
+    if args.gradebook:
+        book = open_gradebook(path_submissions)
+        warn_stale(book, path_submissions)
+        summaries, error_files = scan_gradebook(book, tmpl)
+    else:
+        # summarize every grading sheet, parsing only those changed since the last scan
+        index = open_index(path_submissions, path_template)
+        summaries, error_files = scan_sheets(find_sheets(path_submissions), tmpl, index)
+    if error_files:
+        con.print_warning(f'Leaving out {len(error_files)} sheet(s) that could not be parsed:')
+        for error_file in error_files:
+            con.print(f'  [error]✗[/error] {error_file}')
+
+    matrix = GradeMatrix.from_summaries(path_submissions, summaries, tmpl)
+    if not len(matrix.students):
+        con.print_error(f'No grading sheets found in {path_submissions}')
+        sys.exit(1)
+
+    print_tasks(matrix, tmpl)
+    print_totals(matrix, tmpl)
+    print_outliers(matrix)
+    print_graders(matrix)
+
+    for path, export, what in [
+        (args.csv, matrix.to_csv, 'grades'),
+        (args.npz, matrix.to_npz, 'grade arrays'),
+    ]:
+        if path is None:
+            continue
+        try:
+            export(path)
+        except OSError as e:
+            con.print_error(f'Failed to write {what}: {path}\n\nRun with --debug for details')
+            con.print_debug(con.format_exception_debug(e))
+            sys.exit(1)
+        con.print_success(f'Wrote {what} to {path}')
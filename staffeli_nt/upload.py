@@ -1,72 +1,553 @@
 import argparse
+import collections
+import concurrent.futures
 import os
+import re
+import sys
 import tempfile
+import threading
+import time
+import zipfile
+from typing import Any
 
-from canvasapi import Canvas  # type: ignore[import-untyped]
+from canvasapi.upload import Uploader  # type: ignore[import-untyped]
 
 from . import console as con
-from .util import download, write_file
-from .vas import GradingSheet, load_gradingsheet, load_meta_or_exit, load_template_or_exit
-
-NAME_SHEET = 'grade.yml'
-
-
-def grade(submission, grade, feedback, dry_run=True):
-    # bail if dry
-    con.print_info(f'Submit: user_id={submission.user_id}, grade={grade}')
-
-    # check if feedback is already uploaded
-    duplicate = False
-    try:
-        for comment in submission.submission_comments:
-            try:
-                attachments = comment.attachments
-            except KeyError:
-                attachments = []
-
-            # print('Comment with:', len(attachments), 'attachments')
-            for attachment in attachments:
-                if duplicate:
-                    break
-
-                try:
-                    contents = download(attachment.url).decode('utf-8')
-                except UnicodeDecodeError:
-                    contents = ''
-
-                duplicate = duplicate or contents.strip() == feedback.strip()
-    except AttributeError as e:
-        con.print_error(
+from .cache import MetadataCache
+from .gradebook import NAME_GRADEBOOK, open_gradebook
+from .journal import NAME_JOURNAL, OP_COMMENT, OP_GRADE, UploadJournal, open_journal
+from .ledger import FeedbackLedger, feedback_digest, may_hold_feedback, open_ledger
+from .mirror import open_mirror
+from .render import NAME_FEEDBACK_CACHE, open_feedback_cache, render_feedback
+from .scan_index import SheetSummary, open_index, stat_sheet
+from .sheets import find_sheets, load_sheets
+from .util import RateLimitGate, download, paginate, write_file
+from .vas import GradingSheet, load_meta_or_exit, load_template_or_exit
+
+MAX_UPLOAD_WORKERS = 8
+STEP_PREFETCH = 4  # Students prepared ahead of the one being reviewed with --step
+BULK_GRADE_CHUNK = 500  # Students per bulk grade update job
+BULK_GRADE_POLL_DELAY = 0.5  # Seconds before polling a job, doubled up to the max
+BULK_GRADE_POLL_MAX_DELAY = 5.0
+
+
+class UploadResult:
+    def __init__(
+        self,
+        stud_id,
+        out: con.BufferedOutput,
+        grade=None,
+        error: Exception | None = None,
+        members: list[int] | None = None,
+    ):
+        self.stud_id = stud_id
+        self.members = members or [stud_id]
+        self.out = out
+        self.grade = grade
+        self.error = error
+
+
+class UploadContext:
+    """Everything an upload job needs besides the students and their sheet."""
+
+    def __init__(
+        self,
+        tmpl,
+        assignment,
+        submissions: dict[int, Any],
+        gate: RateLimitGate,
+        ledger: FeedbackLedger,
+        live: bool,
+        bulk_grades: bool = False,
+        inline: bool = False,
+        journal: UploadJournal | None = None,
+    ):
+        self.tmpl = tmpl
+        self.assignment = assignment
+        self.submissions = submissions
+        self.gate = gate
+        self.ledger = ledger
+        self.live = live
+        self.bulk_grades = bulk_grades
+        self.inline = inline
+        self.journal = journal
+        self.deltas: dict[int, Delta] | None = None
+
+
+def is_duplicate(submission, feedback, ledger: FeedbackLedger, out: con.BufferedOutput) -> bool:
+    """
+    Checks whether feedback is already posted as a comment on the submission,
+    either as its text or as an attached file.
+    Attachments known to the ledger are compared by digest. Others are only
+    downloaded if their metadata says they may hold this feedback, and are
+    then recorded in the ledger so they are never downloaded again.
+    """
+    if not hasattr(submission, 'submission_comments'):
+        out.error(
             f'Unexpected Canvas API response structure\n'
             f'Student ID: {submission.user_id}\n'
             f'Missing field: submission_comments\n\n'
             f'Run with --debug for details'
         )
-        con.print_debug(
-            f'Missing attribute on submission object\n'
-            f'Submission repr: {repr(submission)}\n'
-            f'{con.format_exception_debug(e)}'
-        )
+        out.debug(f'Missing attribute on submission object\nSubmission repr: {repr(submission)}')
+        return False
+
+    digest = feedback_digest(feedback)
+    for comment in submission.submission_comments or []:
+        if comment.get('comment') and feedback_digest(comment['comment']) == digest:
+            return True
+        for attachment in comment.get('attachments') or []:
+            known = ledger.digest_of(submission.assignment_id, submission.user_id, attachment['id'])
+            if known is None:
+                if not may_hold_feedback(attachment, feedback):
+                    continue
+                try:
+                    contents = download(attachment['url']).decode('utf-8')
+                except UnicodeDecodeError:
+                    contents = ''
+                known = feedback_digest(contents)
+                ledger.record(submission.assignment_id, submission.user_id, attachment, known)
+            if known == digest:
+                return True
+    return False
+
+
+def grade(
+    submission,
+    grade,
+    feedback,
+    out: con.BufferedOutput,
+    gate: RateLimitGate,
+    ledger: FeedbackLedger,
+    dry_run=True,
+    set_grade=True,
+    members=None,
+    inline=False,
+    journal: UploadJournal | None = None,
+    feedback_posted: bool | None = None,
+    grade_set=False,
+):
+    """
+    Uploads feedback and sets the grade for a submission. When members is given
+    the feedback is posted as a single group comment, together with the grade,
+    and Canvas applies both to every member of the group. With inline the
+    feedback is sent as the text of the comment rather than as a file, in the
+    same request that sets the grade. Steps the journal records as done are
+    skipped, and finished steps are recorded in it. feedback_posted and
+    grade_set pass on what a delta upload already knows about the submission.
+    """
+    group = members is not None and len(members) > 1
+    who = f'group of user_ids: {", ".join(map(str, members))}' if group else 'user_id'
+    user_ids = members if group else [submission.user_id]
+    digest = feedback_digest(feedback)
+
+    # bail if dry
+    out.info(f'Submit: user_id={submission.user_id}, grade={grade}')
+    if group:
+        out.info(f'Feedback is shared by the {who}')
+
+    # check if feedback is already uploaded, the journal knows without asking Canvas
+    if journal is not None and journal.done(submission.assignment_id, user_ids, OP_COMMENT, digest):
+        duplicate = True
+    else:
+        if feedback_posted is not None:
+            duplicate = feedback_posted
+        else:
+            duplicate = is_duplicate(submission, feedback, ledger, out)
+        if duplicate and journal is not None and not dry_run:
+            journal.record(submission.assignment_id, user_ids, OP_COMMENT, digest)
 
     # upload feedback if new
     if duplicate:
-        con.print_info(f'Feedback already uploaded for user_id: {submission.user_id}')
+        out.info(f'Feedback already uploaded for user_id: {submission.user_id}')
+
+    graded = grade_set or (
+        journal is not None and journal.done(submission.assignment_id, user_ids, OP_GRADE, grade)
+    )
 
     if dry_run:
-        con.print_info(f'Would set grade to {grade} for user_id: {submission.user_id}')
+        if graded:
+            out.info(f'Grade {grade} already set for user_id: {submission.user_id}')
+        elif group:
+            out.info(f'Would set grade to {grade} for {who}')
+        else:
+            out.info(f'Would set grade to {grade} for user_id: {submission.user_id}')
         return
 
-    if not duplicate:
-        con.print_info(f'Uploading new feedback: {submission.user_id}')
+    edit: dict[str, Any] = {}
+    if not duplicate and inline:
+        out.info(f'Posting new feedback: {submission.user_id}')
+        edit['comment'] = {'text_comment': feedback}
+        if group:
+            edit['comment']['group_comment'] = True
+    elif not duplicate:
+        out.info(f'Uploading new feedback: {submission.user_id}')
         with tempfile.TemporaryDirectory() as c_dir:
             f_path = os.path.join(c_dir, 'feedback.txt')
-            with open(f_path, 'w') as f:
+            with open(f_path, 'w', encoding='utf-8') as f:
                 f.write(feedback)
-            submission.upload_comment(f_path)
+            if group:
+                # Attach the file with the same request that sets the grade
+                uploaded, attachment = gate.call(upload_comment_file, submission, f_path)
+                if uploaded:
+                    edit['comment'] = {'file_ids': [attachment['id']], 'group_comment': True}
+            else:
+                uploaded, attachment = gate.call(submission.upload_comment, f_path)
+                if uploaded and journal is not None:
+                    journal.record(submission.assignment_id, user_ids, OP_COMMENT, digest)
+        if uploaded:
+            for user_id in user_ids:
+                ledger.record(submission.assignment_id, user_id, attachment, digest)
+
+    # set grade, unless it is posted in bulk afterwards
+    if graded:
+        out.info(f'Grade {grade} already set for user_id: {submission.user_id}')
+    elif not set_grade:
+        out.info(f'Queued grade {grade} for user_id: {submission.user_id}')
+    elif group:
+        out.info(f'Setting grade to {grade} for {who}')
+        edit['submission'] = {'posted_grade': grade}
+    else:
+        out.info(f'Setting grade to {grade} for user_id: {submission.user_id}')
+        edit['submission'] = {'posted_grade': grade}
+
+    if edit:
+        gate.call(submission.edit, **edit)
+        if journal is not None:
+            if 'comment' in edit:
+                journal.record(submission.assignment_id, user_ids, OP_COMMENT, digest)
+            if 'submission' in edit:
+                journal.record(submission.assignment_id, user_ids, OP_GRADE, grade)
+
+
+def upload_comment_file(submission, path) -> tuple[bool, dict[str, Any]]:
+    """
+    Uploads a file for a submission comment without posting the comment,
+    unlike Submission.upload_comment.
+    """
+    result: tuple[bool, dict[str, Any]] = Uploader(
+        submission._requester,
+        f'courses/{submission.course_id}/assignments/{submission.assignment_id}'
+        f'/submissions/{submission.user_id}/comments/files',
+        path,
+    ).start()
+    return result
+
+
+def is_group_graded(assignment) -> bool:
+    """Whether Canvas grades the assignment per group rather than per student."""
+    return getattr(assignment, 'group_category_id', None) is not None and not getattr(
+        assignment, 'grade_group_students_individually', False
+    )
+
+
+def group_handins(handins, submissions, group_graded) -> list[list[int]]:
+    """
+    Splits the students with a grading sheet into upload jobs. Students who
+    share a sheet and are in the same Canvas group form one job when the
+    assignment is graded per group, everybody else gets a job of their own.
+
+    Returns:
+        lists of user ids, the first of which is the one whose submission is used
+    """
+    by_sheet: dict[int, list[int]] = {}
+    for stud_id, sheet in handins.items():
+        by_sheet.setdefault(id(sheet), []).append(stud_id)
+
+    jobs: list[list[int]] = []
+    for members in by_sheet.values():
+        groups = {(getattr(submissions.get(uid), 'group', None) or {}).get('id') for uid in members}
+        if group_graded and len(members) > 1 and len(groups) == 1 and None not in groups:
+            jobs.append(members)
+        else:
+            jobs.extend([uid] for uid in members)
+    return jobs
+
+
+def post_grades_in_bulk(assignment, grades: dict[int, Any], gate: RateLimitGate) -> list[int]:
+    """
+    Posts grades through Canvas's asynchronous bulk update endpoint, in jobs of
+    at most BULK_GRADE_CHUNK students, and waits for each job to finish.
+    Afterwards the posted scores are checked against one listing of submissions.
+
+    Returns:
+        user ids whose grade could not be posted
+    """
+    failed: list[int] = []
+    user_ids = list(grades)
+    for start in range(0, len(user_ids), BULK_GRADE_CHUNK):
+        chunk = user_ids[start : start + BULK_GRADE_CHUNK]
+        con.print_info(f'Posting {len(chunk)} grade(s) in bulk')
+        try:
+            progress = gate.call(
+                assignment.submissions_bulk_update,
+                grade_data={uid: {'posted_grade': grades[uid]} for uid in chunk},
+            )
+            delay = BULK_GRADE_POLL_DELAY
+            while progress.workflow_state not in ('completed', 'failed'):
+                time.sleep(delay)
+                delay = min(delay * 2, BULK_GRADE_POLL_MAX_DELAY)
+                progress = gate.call(progress.query)
+        except Exception as e:
+            con.print_error('Bulk grade update failed\nRun with --debug for details')
+            con.print_debug(con.format_exception_debug(e))
+            failed.extend(chunk)
+            continue
+        if progress.workflow_state == 'failed':
+            message = getattr(progress, 'message', None) or 'no message'
+            con.print_error(f'Bulk grade update failed: {message}')
+            failed.extend(chunk)
+
+    # Check that Canvas ended up with the grades we asked for
+    pending = set(user_ids) - set(failed)
+    for submission in paginate(assignment.get_submissions()):
+        if submission.user_id not in pending:
+            continue
+        pending.discard(submission.user_id)
+        expected = grades[submission.user_id]
+        if not grade_matches(submission, expected):
+            con.print_error(
+                f'Grade for user_id {submission.user_id} is {submission.grade}, expected {expected}'
+            )
+            failed.append(submission.user_id)
+    failed.extend(pending)
+    return failed
 
-    # set grade
-    con.print_info(f'Setting grade to {grade} for user_id: {submission.user_id}')
-    submission.edit(submission={'posted_grade': grade})
+
+def prefetch_submissions(assignment, section, mirror) -> dict[int, Any]:
+    """
+    Fetches every submission for the assignment, with comments, user and group,
+    in one paginated listing. When a section is given only its students are listed.
+
+    Returns:
+        the submissions indexed by user id
+    """
+    if mirror is not None:
+        submissions = mirror.submissions(assignment.id)
+    else:
+        include = ['submission_comments', 'user', 'group']
+        if section is not None:
+            paginated = section.get_multiple_submissions(
+                student_ids=['all'], assignment_ids=[assignment.id], include=include
+            )
+        else:
+            paginated = assignment.get_submissions(include=include)
+        submissions = list(paginate(paginated))
+        if section is not None:
+            # Submissions listed by section lack the course id that their
+            # edit and upload_comment calls build their URLs from
+            for submission in submissions:
+                submission.course_id = assignment.course_id
+    return {s.user_id: s for s in submissions}
+
+
+class PreparedUpload:
+    """An upload job with everything it needs read from Canvas, ready to be written."""
+
+    def __init__(
+        self,
+        members,
+        out: con.BufferedOutput,
+        submission=None,
+        total=None,
+        feedback=None,
+        feedback_posted: bool | None = None,
+        error: Exception | None = None,
+    ):
+        self.members = members
+        self.out = out
+        self.submission = submission
+        self.total = total
+        self.feedback = feedback
+        self.feedback_posted = feedback_posted
+        self.error = error
+
+
+def prepare_upload(members, sheet, ctx: UploadContext, check_feedback=False) -> PreparedUpload:
+    """
+    Fetches the submission of the first of members, taken from the prefetched
+    submissions when it is there, and renders the feedback. With check_feedback
+    the duplicate check runs here as well, so applying the upload only writes.
+    """
+    stud_id = members[0]
+    out = con.BufferedOutput()
+    try:
+        # total score, sheets that are not fully graded are skipped when live
+        total = sheet.get_grade(ctx.tmpl)
+        if total is None and ctx.live:
+            return PreparedUpload(members, out)
+
+        submission = ctx.submissions.get(stud_id)
+        if submission is None:
+            submission = ctx.gate.call(
+                ctx.assignment.get_submission, stud_id, include=['submission_comments']
+            )
+
+        feedback = ctx.tmpl.format_md(sheet)
+
+        delta = ctx.deltas.get(stud_id) if ctx.deltas is not None else None
+        feedback_posted = None if delta is None else not delta.feedback_changed
+        if check_feedback and feedback_posted is None:
+            journaled = ctx.journal is not None and ctx.journal.done(
+                submission.assignment_id, members, OP_COMMENT, feedback_digest(feedback)
+            )
+            feedback_posted = journaled or is_duplicate(submission, feedback, ctx.ledger, out)
+    except InterruptedError:
+        raise
+    except Exception as e:
+        out.error(f'Upload failed for user_id: {stud_id}\nRun with --debug for details')
+        out.debug(con.format_exception_debug(e))
+        return PreparedUpload(members, out, error=e)
+    return PreparedUpload(members, out, submission, total, feedback, feedback_posted)
+
+
+def apply_upload(prepared: PreparedUpload, ctx: UploadContext) -> UploadResult:
+    """
+    Uploads feedback and grade for a prepared upload job.
+    More than one member means the feedback is posted once for their group.
+    """
+    members = prepared.members
+    stud_id = members[0]
+    out = prepared.out
+    if prepared.error is not None:
+        return UploadResult(stud_id, out, error=prepared.error, members=members)
+    if prepared.total is None and ctx.live:
+        return UploadResult(stud_id, out, members=members)
+
+    delta = ctx.deltas.get(stud_id) if ctx.deltas is not None else None
+    try:
+        grade(
+            prepared.submission,
+            prepared.total,
+            prepared.feedback,
+            out,
+            ctx.gate,
+            ctx.ledger,
+            dry_run=not ctx.live,
+            set_grade=not ctx.bulk_grades,
+            members=members,
+            inline=ctx.inline,
+            journal=ctx.journal,
+            feedback_posted=prepared.feedback_posted,
+            grade_set=delta is not None and not delta.grade_changed,
+        )
+    except InterruptedError:
+        raise
+    except Exception as e:
+        out.error(f'Upload failed for user_id: {stud_id}\nRun with --debug for details')
+        out.debug(con.format_exception_debug(e))
+        return UploadResult(stud_id, out, error=e, members=members)
+    return UploadResult(stud_id, out, grade=prepared.total, members=members)
+
+
+def upload_submission(members, sheet, ctx: UploadContext) -> UploadResult:
+    """
+    Uploads feedback and grade for the submission of the first of members.
+    This function is designed to be run in a parallel executor, so it never
+    prints directly, and failures are returned in the result instead of raised.
+    """
+    return apply_upload(prepare_upload(members, sheet, ctx), ctx)
+
+
+def grade_matches(submission, grade) -> bool:
+    """Whether Canvas already has grade as the grade of the submission."""
+    if submission is None or grade is None:
+        return False
+    try:
+        return float(submission.score) == float(grade)
+    except (TypeError, ValueError):
+        return submission.grade is not None and str(submission.grade) == str(grade)
+
+
+class Delta:
+    """What uploading a sheet would change on Canvas, for one upload job."""
+
+    def __init__(self, members, old_grade, new_grade, grade_changed, feedback_changed):
+        self.members = members
+        self.old_grade = old_grade
+        self.new_grade = new_grade
+        self.grade_changed = grade_changed
+        self.feedback_changed = feedback_changed
+
+    def changed(self) -> bool:
+        return bool(self.grade_changed or self.feedback_changed)
+
+    def describe(self) -> str:
+        changes = []
+        if self.grade_changed:
+            changes.append(f'grade {self.old_grade} -> {self.new_grade}')
+        if self.feedback_changed:
+            changes.append('new feedback')
+        return f'user_id {", ".join(map(str, self.members))}: ' + ', '.join(changes)
+
+
+def compute_delta(members, sheet, ctx: UploadContext) -> Delta:
+    """
+    Compares a sheet with the prefetched Canvas state of its students.
+    When that state cannot be fetched, everything counts as changed so the
+    upload itself reports the error.
+    """
+    out = con.BufferedOutput()
+    try:
+        submissions = []
+        for stud_id in members:
+            submission = ctx.submissions.get(stud_id)
+            if submission is None:
+                submission = ctx.gate.call(
+                    ctx.assignment.get_submission, stud_id, include=['submission_comments']
+                )
+            submissions.append(submission)
+        total = sheet.get_grade(ctx.tmpl)
+        old_grade = submissions[0].grade
+        grade_changed = total is not None and not all(grade_matches(s, total) for s in submissions)
+        feedback_changed = not is_duplicate(
+            submissions[0], ctx.tmpl.format_md(sheet), ctx.ledger, out
+        )
+    except InterruptedError:
+        raise
+    except Exception as e:
+        con.print_debug(con.format_exception_debug(e))
+        return Delta(members, None, None, True, True)
+    finally:
+        out.flush()
+    return Delta(members, old_grade, total, grade_changed, feedback_changed)
+
+
+def archive_name(student) -> str:
+    """
+    Name of a student's feedback file in an archive for Canvas's re-upload of
+    submissions, which takes the first all-digit part between underscores as
+    the Canvas user id, like in the archives Canvas hands out.
+    """
+    name = re.sub('[^a-z]', '', student.name.lower()) or 'student'
+    return f'{name}_{student.id}_feedback.txt'
+
+
+def export_archive(path, sheets: list[tuple[str, GradingSheet]], tmpl) -> None:
+    """
+    Writes the feedback of every graded sheet into one zip archive, with a file
+    per student, for Canvas's bulk upload of feedback files.
+    """
+    students = sorted(
+        ((student, sheet) for _, sheet in sheets for student in sheet.students),
+        key=lambda item: item[0].id,
+    )
+    tmp_path = f'{path}.tmp'
+    count = 0
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for student, sheet in students:
+                if sheet.get_grade(tmpl) is None:
+                    con.print_warning(f'Not exporting ungraded sheet of user_id: {student.id}')
+                    continue
+                archive.writestr(archive_name(student), tmpl.format_md(sheet))
+                count += 1
+        os.replace(tmp_path, path)
+    except OSError as e:
+        con.print_error(f'Failed to write feedback archive: {path}\n\nRun with --debug for details')
+        con.print_debug(con.format_exception_debug(e))
+        sys.exit(1)
+    con.print_success(f'Wrote feedback for {count} student(s) to {path}')
 
 
 def add_subparser(subparsers: argparse._SubParsersAction):
@@ -90,12 +571,62 @@ def add_subparser(subparsers: argparse._SubParsersAction):
         action='store_true',
         help='to review all feedback for submissions in the directory',
     )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=STEP_PREFETCH,
+        metavar='K',
+        help=f'with --step, number of students to prepare ahead (default: {STEP_PREFETCH})',
+    )
     parser.add_argument('--warn-missing', action='store_true', help='warn if grades are missing')
+    parser.add_argument(
+        '--bulk-grades',
+        action='store_true',
+        help="post all grades at the end through Canvas's bulk grade update",
+    )
+    parser.add_argument(
+        '--delta',
+        action='store_true',
+        help='only upload sheets whose grade or feedback differs from Canvas',
+    )
+    parser.add_argument(
+        '--export-archive',
+        metavar='PATH',
+        help="write all feedback to a zip archive at PATH for Canvas's bulk upload, "
+        'instead of uploading',
+    )
+    parser.add_argument(
+        '--inline',
+        action='store_true',
+        help='post feedback as comment text together with the grade, instead of as a file',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=MAX_UPLOAD_WORKERS,
+        metavar='N',
+        help=f'number of submissions to upload concurrently (default: {MAX_UPLOAD_WORKERS})',
+    )
+    parser.add_argument(
+        '--ignore-journal',
+        action='store_true',
+        help=f'check every student against Canvas, also those {NAME_JOURNAL} records as done',
+    )
     parser.add_argument(
         '--write-local',
         action='store_true',
         help='writes the feedback locally unless --live is given',
     )
+    parser.add_argument(
+        '--feedback-cache',
+        action='store_true',
+        help=f'keep rendered feedback in {NAME_FEEDBACK_CACHE} and only render changed sheets',
+    )
+    parser.add_argument(
+        '--gradebook',
+        action='store_true',
+        help=f'read the sheets from {NAME_GRADEBOOK} instead of the grade.yml files',
+    )
     parser.set_defaults(main=main)
 
 
@@ -106,26 +637,41 @@ def main(api_url, api_key, args: argparse.Namespace):
     step = args.step
     warn_missing = args.warn_missing
     write_local = args.write_local and not live
-
-    sheets: list[tuple[str, GradingSheet]] = []
+    workers = max(1, args.workers)
+    prefetch = max(1, args.prefetch)
 
     meta_file = os.path.join(path_submissions, 'meta.yml')
 
     meta = load_meta_or_exit(meta_file)
     tmpl = load_template_or_exit(path_template)
 
-    # fetch every grading sheet
-    error_files: list[str] = []
-    for root, dirs, files in os.walk(path_submissions, followlinks=True):
-        for name in files:
-            if name != NAME_SHEET:
-                continue
+    if args.gradebook:
+        book = open_gradebook(path_submissions)
+        # Refuse to post grades that the grade.yml files have moved on from
+        if live and (stale := book.stale_files()):
+            con.print_error(
+                f"""Cannot upload - {len(stale)} grade sheet(s) changed since the gradebook import.
 
-            path = os.path.join(root, name)
-            if (result := load_gradingsheet(path)) is not None:
-                sheets.append(result)
-            else:
-                error_files.append(path)
+Changed files:"""
+            )
+            for stale_file in stale:
+                con.print(f'  [error]✗[/error] {stale_file}')
+            con.print_error(
+                f"""
+Import them with: staffeli gradebook import {path_submissions}"""
+            )
+            exit(1)
+        sheets, error_files = book.sheets()
+    else:
+        # fetch every grading sheet, keeping the scan index up to date on the way
+        paths = find_sheets(path_submissions, follow_links=True)
+        stamps = {path: stat_sheet(path) for path in paths}
+        sheets, error_files = load_sheets(paths)
+        index = open_index(path_submissions, path_template)
+        for path, sheet in sheets:
+            if (stamp := stamps[path]) is not None:
+                index.store(path, stamp, SheetSummary.of(sheet, tmpl))
+        index.save()
 
     # Abort if there are errors in grade sheets
     if error_files:
@@ -160,39 +706,158 @@ Run with --debug for detailed error information."""
             assert student.id not in handins, 'student assigned multiple sheets'
             handins[student.id] = sheet
 
-    canvas = Canvas(api_url, api_key)
-    course = canvas.get_course(meta.course.id)
-    assignment = course.get_assignment(meta.assignment.id)
-    submissions = []
+    # Render the feedback once, for the uploads, --step, --delta and the local copies alike
+    rendered = open_feedback_cache(path_submissions, path_template) if args.feedback_cache else None
+    render_feedback(sheets, tmpl, rendered)
+
+    if args.export_archive is not None:
+        export_archive(args.export_archive, sheets, tmpl)
+        return
+
+    cache = MetadataCache(api_url, api_key, meta.course.id, refresh=args.refresh)
+    assignment = cache.get_assignment(meta.assignment.id)
     section = None
 
     if meta.assignment.section is not None:
-        section = course.get_section(meta.assignment.section, include=['students', 'enrollments'])
+        section = cache.get_section(meta.assignment.section)
         con.print_info(f'Prepare upload for section {section}')
 
-    if live:
+    mirror = open_mirror(args.mirror, cache)
+    if mirror is not None:
+        # Comments added without a grade change escape an incremental sync, and a
+        # live upload must see every comment to not post its feedback twice
+        mirror.sync(assignment.id, full=args.refresh or live)
+
+    # One listing serves both the uploads and the --warn-missing report
+    submissions = prefetch_submissions(assignment, section, mirror)
+
+    cancel_event = threading.Event()
+    gate = RateLimitGate(cancel_event)
+    ledger = open_ledger(path_submissions)
+    journal = open_journal(path_submissions, ignore_existing=args.ignore_journal)
+    ctx = UploadContext(
+        tmpl, assignment, submissions, gate, ledger, live, args.bulk_grades, args.inline, journal
+    )
+
+    # Group members who share a sheet get their feedback posted once
+    jobs = group_handins(handins, submissions, is_group_graded(assignment))
+
+    if args.delta:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            deltas = list(
+                executor.map(lambda members: compute_delta(members, handins[members[0]], ctx), jobs)
+            )
+        changed = [d for d in deltas if d.changed()]
+        if changed:
+            con.print('[info]Changes compared to Canvas:[/info]')
+            for d in changed:
+                con.print(f'  {d.describe()}')
+        con.print_info(f'{len(changed)} of {len(jobs)} upload(s) have changes')
+        ctx.deltas = {d.members[0]: d for d in deltas}
+        jobs = [d.members for d in changed]
+
+    if live and jobs:
         con.print(f'[info]Uploading feedback for assignment:[/info] {assignment.name}')
         if not con.ask_confirm('Upload feedback for this assignment?'):
             return
-    else:
+    elif not live:
         con.print_info('Doing a dry-run...')
 
-    for stud_id, sheet in handins.items():
-        submission = assignment.get_submission(stud_id, include=['submission_comments'])
-
-        # total score
-        total = sheet.get_grade(tmpl)
-        if total is None and live:
-            continue
-
-        grade(submission, total, tmpl.format_md(sheet), dry_run=not live)
-
-        if step:
-            con.print(f'[info]Feedback for {stud_id}:[/info]')
-            con.print(tmpl.format_md(sheet))
-            con.print('-----------------------------------\n')
-            input()
-            con.print('\n' * 2)
+    failures: list[UploadResult] = []
+    queued: dict[int, Any] = {}
+
+    def collect(outcome: UploadResult):
+        outcome.out.flush()
+        if outcome.error is not None:
+            failures.append(outcome)
+        elif outcome.grade is not None:
+            for uid in outcome.members:
+                queued[uid] = outcome.grade
+
+    if step:
+        # The next students are prepared while the current one is reviewed,
+        # and confirmed uploads are written in the background
+        readers = concurrent.futures.ThreadPoolExecutor(max_workers=prefetch)
+        writers = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        upcoming = iter(jobs)
+        prepared: collections.deque[concurrent.futures.Future[PreparedUpload]] = collections.deque()
+        written: collections.deque[concurrent.futures.Future[UploadResult]] = collections.deque()
+
+        def prepare_ahead():
+            while len(prepared) < prefetch and (members := next(upcoming, None)) is not None:
+                sheet = handins[members[0]]
+                prepared.append(readers.submit(prepare_upload, members, sheet, ctx, True))
+
+        def collect_written(wait: bool):
+            while written and (wait or written[0].done()):
+                collect(written.popleft().result())
+
+        try:
+            prepare_ahead()
+            while prepared:
+                job = prepared.popleft().result()
+                prepare_ahead()
+                collect_written(wait=False)
+                if job.error is None and job.total is None and live:
+                    # Not fully graded, apply_upload skips it
+                    written.append(writers.submit(apply_upload, job, ctx))
+                    continue
+
+                con.print(f'[info]Feedback for {", ".join(map(str, job.members))}:[/info]')
+                con.print(job.feedback or tmpl.format_md(handins[job.members[0]]))
+                con.print('-----------------------------------\n')
+                input()
+                con.print('\n' * 2)
+                written.append(writers.submit(apply_upload, job, ctx))
+            collect_written(wait=True)
+        except KeyboardInterrupt:
+            con.print_warning('Interrupted, waiting for running uploads to complete...')
+            cancel_event.set()
+            readers.shutdown(wait=True, cancel_futures=True)
+            writers.shutdown(wait=True, cancel_futures=True)
+            raise
+        else:
+            readers.shutdown(wait=True)
+            writers.shutdown(wait=True)
+    else:
+        # Results come back in submission order, so output stays deterministic
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        try:
+            for outcome in executor.map(
+                lambda members: upload_submission(members, handins[members[0]], ctx),
+                jobs,
+            ):
+                collect(outcome)
+        except KeyboardInterrupt:
+            con.print_warning('Interrupted, waiting for running uploads to complete...')
+            cancel_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        else:
+            executor.shutdown(wait=True)
+
+    if ctx.bulk_grades and live:
+        # With --delta, grades Canvas already has are not posted again
+        unchanged = {
+            uid for d in (ctx.deltas or {}).values() if not d.grade_changed for uid in d.members
+        }
+        pending = {
+            uid: g
+            for uid, g in queued.items()
+            if uid not in unchanged and not journal.done(assignment.id, [uid], OP_GRADE, g)
+        }
+        if pending:
+            failed_grades = post_grades_in_bulk(assignment, pending, gate)
+            failures += [UploadResult(uid, con.BufferedOutput()) for uid in failed_grades]
+            posted = [uid for uid in pending if uid not in failed_grades]
+            for uid in posted:
+                journal.record(assignment.id, [uid], OP_GRADE, pending[uid])
+
+    if failures:
+        con.print_error(
+            f'{len(failures)} of {len(jobs)} upload(s) failed, for user_id(s):\n'
+            + ', '.join(str(uid) for r in failures for uid in r.members)
+        )
 
     if write_local:
         con.print_info('Writing local feedback files')
@@ -205,19 +870,22 @@ Run with --debug for detailed error information."""
         con.print('\n[info]Checking if some students are missing grades...[/info]')
         all_graded = True
 
+        s_ids = None
         if section:
             s_ids = [
                 s['id']
                 for s in section.students
                 if all([e['enrollment_state'] == 'active' for e in s['enrollments']])
             ]
-            submissions = section.get_multiple_submissions(
-                assignment_ids=[assignment.id], student_ids=s_ids, include=['user', 'group']
-            )
-        else:
-            submissions = assignment.get_submissions(include=['user', 'group'])
 
-        for submission in submissions:
+        # The prefetched states predate this run, so count the grades set above
+        failed = {uid for r in failures for uid in r.members}
+        graded_now = set(queued) - failed if live else set()
+        for submission in submissions.values():
+            if s_ids is not None and submission.user_id not in s_ids:
+                continue
+            if submission.user_id in graded_now:
+                continue
             if submission.workflow_state in ('submitted', 'pending_review'):
                 name = submission.user['short_name']
                 group = ''.join(f'({g})' for g in [submission.group.get('name')] if g)
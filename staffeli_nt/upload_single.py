@@ -1,15 +1,22 @@
 import argparse
+import concurrent.futures
+import csv
+import json
 import sys
+import threading
 from os import R_OK, access
 from os.path import isfile
 
 from canvasapi import Canvas  # type: ignore[import-untyped]
 
+from . import console as con
+from .cache import MetadataCache
 from .console import ask_confirm, console, print_error, print_info
-from .util import load_and_parse_yaml
+from .util import RateLimitGate, load_and_parse_yaml
 from .vas import load_meta_or_exit, parse_sheet
 
 NAME_SHEET = 'grade.yml'
+MAX_BATCH_WORKERS = 8
 
 
 def grade(submission, grade, path_feedback, dry_run=True):
@@ -26,31 +33,209 @@ def grade(submission, grade, path_feedback, dry_run=True):
     submission.edit(submission={'posted_grade': grade})
 
 
+def read_jobs(stream):
+    """
+    Reads upload jobs from a stream, one per line, either as CSV with the
+    columns points, grade sheet and feedback file (a header line is skipped),
+    or as JSON objects with the keys points, grade and feedback.
+    Blank lines and lines starting with # are ignored.
+
+    Yields:
+        (line number, points, grade sheet path, feedback path), with None for
+        the paths of lines that cannot be read
+    """
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            if line.startswith('{'):
+                job = json.loads(line)
+                yield number, str(job['points']), job['grade'], job['feedback']
+                continue
+            row = next(csv.reader([line]))
+            if row[0].strip().lower() == 'points':
+                continue
+            points, path_grade_yml, path_feedback = (cell.strip() for cell in row)
+            yield number, points, path_grade_yml, path_feedback
+        except (ValueError, KeyError, TypeError):
+            yield number, None, None, None
+
+
+def run_job(job, assignment, gate, live) -> dict:
+    """
+    Uploads feedback and grade for every student on the grade sheet of a job
+    as read by read_jobs.
+    This function is designed to be run in a parallel executor, so failures are
+    returned in the result line instead of raised.
+
+    Returns:
+        the result line for the job
+    """
+    number, points, path_grade_yml, path_feedback = job
+    result = {'line': number, 'grade': path_grade_yml, 'status': 'ok', 'user_ids': []}
+    if path_grade_yml is None:
+        return {**result, 'status': 'failed', 'error': 'cannot parse job'}
+    if not (isfile(path_feedback) and access(path_feedback, R_OK)):
+        return {**result, 'status': 'failed', 'error': f'cannot read {path_feedback}'}
+    if (sheet := load_and_parse_yaml(path_grade_yml, parse_sheet, 'grade sheet')) is None:
+        return {**result, 'status': 'failed', 'error': f'cannot parse {path_grade_yml}'}
+
+    try:
+        for student in sheet.students:
+            if live:
+                submission = gate.call(assignment.get_submission, student.id)
+                gate.call(submission.upload_comment, path_feedback)
+                gate.call(submission.edit, submission={'posted_grade': points})
+            result['user_ids'].append(student.id)
+    except InterruptedError:
+        raise
+    except Exception as e:
+        con.print_debug(con.format_exception_debug(e))
+        return {**result, 'status': 'failed', 'error': str(e)}
+    if not live:
+        result['status'] = 'dry-run'
+    return result
+
+
+def run_batch(api_url, api_key, args: argparse.Namespace, path_meta_yml):
+    """
+    Runs the upload jobs read from args.batch, resolving the course and
+    assignment once, and prints a JSON result line per job as it finishes.
+    """
+    meta = load_meta_or_exit(path_meta_yml)
+    cache = MetadataCache(api_url, api_key, meta.course.id, refresh=args.refresh)
+    assignment = cache.get_assignment(meta.assignment.id)
+    live = args.live
+    from_stdin = args.batch == '-'
+
+    if live:
+        console.print(f'[info]Uploading feedback to:[/info] {assignment}')
+        # Jobs arriving on stdin leave no way to answer a prompt
+        if not args.yes and (from_stdin or not sys.stdin.isatty()):
+            print_error(
+                'Cannot ask for confirmation, as stdin is not a terminal.\n'
+                'Run again with --yes to upload without confirmation.'
+            )
+            sys.exit(1)
+        if not args.yes and not ask_confirm('Sure?'):
+            return
+
+    try:
+        stream = sys.stdin if from_stdin else open(args.batch, 'r', encoding='utf-8')
+    except OSError as e:
+        print_error(f'Cannot read batch file: {args.batch}\n{e}')
+        sys.exit(1)
+
+    workers = max(1, args.workers)
+    cancel_event = threading.Event()
+    gate = RateLimitGate(cancel_event)
+    failed = 0
+
+    def report(done):
+        nonlocal failed
+        for future in done:
+            result = future.result()
+            failed += result['status'] == 'failed'
+            # Plain lines on stdout, for the program driving the batch
+            print(json.dumps(result), flush=True)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    running: set[concurrent.futures.Future] = set()
+    try:
+        with stream:
+            for job in read_jobs(stream):
+                # Bound the jobs in flight, so a long stream is not read ahead
+                if len(running) >= 2 * workers:
+                    done, running = concurrent.futures.wait(
+                        running, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    report(done)
+                running.add(executor.submit(run_job, job, assignment, gate, live))
+        report(concurrent.futures.as_completed(running))
+    except KeyboardInterrupt:
+        con.print_warning('Interrupted, waiting for running uploads to complete...')
+        cancel_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    else:
+        executor.shutdown(wait=True)
+
+    if failed:
+        sys.exit(1)
+
+
 def add_subparser(subparsers: argparse._SubParsersAction):
     parser: argparse.ArgumentParser = subparsers.add_parser(
         name='upload-single', help='upload feedback for a single submission'
     )
-    parser.add_argument('points', type=str, metavar='INT', help='number of points given')
+    parser.add_argument('points', type=str, nargs='?', metavar='INT', help='number of points given')
     parser.add_argument(
         'path_meta_yml',
         type=str,
+        nargs='?',
         metavar='META_PATH',
         help='YAML file containg meta data related to the submission',
     )
     parser.add_argument(
-        'path_grade_yml', type=str, metavar='GRADE_PATH', help='YAML file containing the grade'
+        'path_grade_yml',
+        type=str,
+        nargs='?',
+        metavar='GRADE_PATH',
+        help='YAML file containing the grade',
     )
     parser.add_argument(
         'path_feedback',
         type=str,
+        nargs='?',
         metavar='FEEDBACK_PATH',
         help='the path to the text file containing feedback',
     )
     parser.add_argument('--live', action='store_true', help='upload feedback for submission')
+    parser.add_argument(
+        '--batch',
+        metavar='JOBS',
+        help='read (points, grade sheet, feedback) jobs as CSV or JSON lines from JOBS, '
+        "or '-' for stdin, and give only META_PATH as argument",
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=MAX_BATCH_WORKERS,
+        metavar='N',
+        help=f'with --batch, number of jobs to run concurrently (default: {MAX_BATCH_WORKERS})',
+    )
+    parser.add_argument(
+        '--yes',
+        action='store_true',
+        help='with --batch --live, upload without asking for confirmation '
+        '(needed when stdin is not a terminal)',
+    )
     parser.set_defaults(main=main)
 
 
 def main(api_url, api_key, args: argparse.Namespace):
+    given = [
+        arg
+        for arg in (args.points, args.path_meta_yml, args.path_grade_yml, args.path_feedback)
+        if arg is not None
+    ]
+    if args.batch is not None:
+        if len(given) != 1:
+            print_error(
+                'With --batch, give the path to meta.yml as the only argument\n\n'
+                'Example: staffeli upload-single --batch jobs.csv meta.yml'
+            )
+            sys.exit(1)
+        run_batch(api_url, api_key, args, given[0])
+        return
+    if len(given) != 4:
+        print_error(
+            'Missing arguments, expected POINTS META_PATH GRADE_PATH FEEDBACK_PATH\n\n'
+            'For more help: staffeli upload-single --help'
+        )
+        sys.exit(1)
+
     points = args.points
     path_meta_yml = args.path_meta_yml
     path_grade_yml = args.path_grade_yml
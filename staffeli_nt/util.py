@@ -1,19 +1,32 @@
 import collections
+import concurrent.futures
 import os
+import random
 import sys
+import threading
 import time
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
 from pathlib import Path
 from typing import Any, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from zipfile import ZipFile
 
 import requests
+from canvasapi.exceptions import CanvasException, RateLimitExceeded  # type: ignore[import-untyped]
 from ruamel.yaml import YAML
 
 from .console import format_exception_debug, print_debug, print_error
 
 T = TypeVar('T')
 
+# Canvas API rate limit settings
+RATE_LIMIT_RETRY_DELAY = 2.0  # base wait when rate limited, doubled per attempt
+MAX_RATE_LIMIT_RETRIES = 4
+
+# Canvas pagination settings
+PER_PAGE = 100  # Canvas caps per_page at 100 for most endpoints
+PREFETCH_PAGES = 4  # Number of numbered pages requested ahead of the consumer
+
 
 def create_yaml():
     """Create a new YAML instance with standard configuration.
@@ -27,11 +40,29 @@ def create_yaml():
     return y
 
 
+_safe_yaml = threading.local()
+
+
+def safe_load_yaml(data: str) -> Any:
+    """Load YAML into plain Python objects with a safe loader.
+
+    Uses the C parser when ruamel.yaml.clib is installed, and pure Python
+    otherwise. Unlike the round-trip loader of create_yaml, comments and
+    scalar styles are not kept, which makes loading several times faster.
+    Each thread gets its own loader.
+    """
+    loader = getattr(_safe_yaml, 'loader', None)
+    if loader is None:
+        loader = _safe_yaml.loader = YAML(typ='safe')
+    return loader.load(data)
+
+
 def dump_yaml(
     path: str,
     data: Any,
     file_description: str = 'YAML file',
     exit_on_error: bool = False,
+    emit: Callable[[Any], str | None] | None = None,
 ) -> bool:
     """Dump data to YAML file with proper error handling.
 
@@ -40,14 +71,19 @@ def dump_yaml(
         data: Data to dump (dict, list, or any YAML-serializable type)
         file_description: Human-readable description for error messages
         exit_on_error: If True, exit on error; if False, return False on error
+        emit: Fast emitter for data of a known shape, returning the same text as
+            ruamel.yaml would, or None to let ruamel.yaml dump it
 
     Returns:
         True on success, False on failure (unless exit_on_error=True)
     """
     try:
-        yaml_instance = create_yaml()
+        text = emit(data) if emit is not None else None
         with open(path, 'w') as f:
-            yaml_instance.dump(data, f)
+            if text is not None:
+                f.write(text)
+            else:
+                create_yaml().dump(data, f)
         return True
     except OSError as e:
         print_error(f'Failed to write {file_description}: {path}\n\nRun with --debug for details')
@@ -149,6 +185,210 @@ def download_streaming(
     raise RuntimeError(f'Failed to download {url} after {retries} retries')
 
 
+def _page_number(url: str) -> int | None:
+    """Return the numeric ``page`` parameter of a pagination link, if it has one."""
+    for key, value in parse_qsl(urlsplit(url).query):
+        if key == 'page':
+            return int(value) if value.isdigit() else None
+    return None
+
+
+def _with_page_number(url: str, page: int) -> str:
+    """Return the pagination link ``url`` rewritten to point at ``page``."""
+    parts = urlsplit(url)
+    query = [(k, str(page) if k == 'page' else v) for k, v in parse_qsl(parts.query)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def follow_pages(
+    requester: Any,
+    response: Any,
+    parse: Callable[[Any], list[T]],
+    method: str = 'GET',
+    prefetch: int = PREFETCH_PAGES,
+) -> Iterator[T]:
+    """Yield the parsed elements of every page following a first page response.
+
+    If the Link header exposes numbered pages, the following pages are
+    requested concurrently (at most ``prefetch`` at a time) while the caller
+    consumes the current one. Bookmark-style links are followed one page at a
+    time.
+
+    Args:
+        requester: The canvasapi Requester that made the first request
+        response: Response for the first page
+        parse: Function turning a page response into a list of elements
+        method: HTTP request method
+        prefetch: Maximum number of pages in flight
+
+    Yields:
+        Elements of the pages after the first one, in server order
+    """
+
+    def fetch(url: str) -> tuple[list[T], dict | None]:
+        page = requester.request(method, _url=url)
+        return parse(page), page.links.get('next')
+
+    next_link = response.links.get('next')
+    if next_link is None:
+        return
+
+    next_page = _page_number(next_link['url'])
+    if next_page is None:
+        while next_link is not None:
+            page_elements, next_link = fetch(next_link['url'])
+            yield from page_elements
+        return
+
+    last_link = response.links.get('last')
+    last_page = _page_number(last_link['url']) if last_link else None
+    template_url = next_link['url']
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=prefetch)
+    try:
+        pending: collections.deque[concurrent.futures.Future] = collections.deque()
+
+        def fill() -> None:
+            nonlocal next_page
+            while len(pending) < prefetch and (last_page is None or next_page <= last_page):
+                pending.append(executor.submit(fetch, _with_page_number(template_url, next_page)))
+                next_page += 1
+
+        fill()
+        while pending:
+            page_elements, has_next = pending.popleft().result()
+            yield from page_elements
+            # Without a known last page, a page without a next link ends the list
+            if last_page is None and has_next is None:
+                break
+            fill()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Private PaginatedList attributes paginate() reads, as set by canvasapi 3.x
+PAGINATED_ATTRIBUTES = (
+    '_requester',
+    '_request_method',
+    '_first_url',
+    '_first_params',
+    '_url_override',
+    '_root',
+    '_content_class',
+    '_extra_attribs',
+)
+
+
+def paginate(
+    paginated: Any,
+    per_page: int = PER_PAGE,
+    prefetch: int = PREFETCH_PAGES,
+) -> Iterator[Any]:
+    """Iterate a canvasapi PaginatedList using large pages and concurrent prefetching.
+
+    The first page is requested with ``per_page`` set, the rest are fetched
+    with follow_pages(). This reads private attributes of the PaginatedList;
+    should a canvasapi release lack any of them, the list is iterated as is.
+
+    Args:
+        paginated: A PaginatedList as returned by canvasapi list calls
+        per_page: Page size to request
+        prefetch: Maximum number of pages in flight
+
+    Yields:
+        The objects of the list in server order
+    """
+    if not all(hasattr(paginated, attribute) for attribute in PAGINATED_ATTRIBUTES):
+        print_debug('PaginatedList lacks the expected attributes, fetching pages one by one')
+        yield from paginated
+        return
+
+    requester = paginated._requester
+    method = paginated._request_method
+
+    def elements(response) -> list[Any]:
+        data = response.json()
+        if paginated._root:
+            data = data[paginated._root]
+        return [
+            paginated._content_class(requester, {**element, **paginated._extra_attribs})
+            for element in data
+            if element is not None
+        ]
+
+    # Requester.request extends the _kwargs list in place, so hand it a copy
+    params = dict(paginated._first_params)
+    if '_kwargs' in params:
+        params['_kwargs'] = list(params['_kwargs'])
+    params['per_page'] = per_page
+    response = requester.request(
+        method, paginated._first_url, _url=paginated._url_override, **params
+    )
+    yield from elements(response)
+    yield from follow_pages(requester, response, elements, method, prefetch)
+
+
+def is_rate_limit_error(e: BaseException) -> bool:
+    """Check whether an exception, or anything in its cause chain, is a Canvas 429."""
+    current: BaseException | None = e
+    while current is not None:
+        if isinstance(current, RateLimitExceeded) or (
+            isinstance(current, CanvasException) and '429' in str(current)
+        ):
+            return True
+        current = current.__cause__
+    return False
+
+
+class RateLimitGate:
+    """Shared backoff for worker threads calling the Canvas API.
+
+    When one worker is rate limited, every worker holds off new calls until
+    the backoff has passed, instead of each of them running into 429s.
+    """
+
+    def __init__(
+        self,
+        cancel_event: threading.Event | None = None,
+        retries: int = MAX_RATE_LIMIT_RETRIES,
+        delay: float = RATE_LIMIT_RETRY_DELAY,
+    ):
+        self.cancel_event = cancel_event or threading.Event()
+        self.retries = retries
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self) -> None:
+        """Block until any current backoff has passed."""
+        while (remaining := self._resume_at - time.monotonic()) > 0:
+            if self.cancel_event.wait(remaining):
+                raise InterruptedError('Operation cancelled during rate limit backoff')
+
+    def backoff(self, delay: float) -> None:
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Call fn, retrying with exponential backoff and jitter when rate limited.
+
+        Raises:
+            The last exception if fn is still rate limited after all retries
+        """
+        for attempt in range(self.retries + 1):
+            self.wait()
+            try:
+                return fn(*args, **kwargs)
+            except CanvasException as e:
+                if attempt == self.retries or not is_rate_limit_error(e):
+                    raise
+                # Add random jitter (0-500ms) to avoid thundering herd problem
+                delay = self.delay * 2**attempt + random.uniform(0, 0.5)
+                print_debug(f'Rate limit exceeded, backing off for {delay:.2f}s')
+                self.backoff(delay)
+        raise AssertionError('unreachable')
+
+
 def run_onlineTA(base, handin, url):
     path = sorted(Path(handin).rglob('README*'))
     if path:
@@ -1,15 +1,20 @@
 import collections
+import re
 import sys
 from typing import Any, List, Optional, Tuple
 
+from ruamel.yaml.scalarstring import LiteralScalarString
+
 from .console import print_warning
-from .util import create_yaml, load_and_parse_yaml
+from .util import create_yaml, load_and_parse_yaml, safe_load_yaml
 
 # Global YAML instance for sequential use
 yaml = create_yaml()
 
 
 class Task:
+    __slots__ = ('name', 'title', 'points', 'default', 'rubric')
+
     name: str
 
     def __init__(self, name: str, title: str, points, default, rubric: str):
@@ -50,19 +55,29 @@ class Assignment:
         for task in self.tasks:
             if task.points is not None:
                 self.total_points += task.points
+        # Tasks by name, for looking up the task of each solution in a sheet
+        self.task_index = {task.name: task for task in self.tasks}
 
     def format_md(self, sheet):
         assert isinstance(sheet, GradingSheet)
-        if not sheet.is_graded(self):
+        if sheet._feedback is not None and sheet._feedback[0] is self:
+            return sheet._feedback[1]
+        feedback = self._format_md(sheet)
+        sheet._feedback = (self, feedback)
+        return feedback
+
+    def _format_md(self, sheet):
+        graded = sheet.is_graded(self)
+        if not graded:
             print_warning('Trying to format sheet that is not finished graded')
 
         solutions = {}
         for solution in sheet.solutions:
             solutions[solution.name] = solution
 
-        assert all([s in [t.name for t in self.tasks] for s in solutions])
+        assert all(s in self.task_index for s in solutions)
 
-        body = ''
+        body = []
         for task in self.tasks:
             if task.name not in solutions:
                 continue
@@ -72,7 +87,7 @@ class Assignment:
             form = ''
             form += '# %s\n' % task.title
 
-            if sheet.is_graded(self) and self.show_points:
+            if graded and self.show_points:
                 grade = solution.get_grade(task)
 
                 if solution.bonus:
@@ -90,9 +105,9 @@ class Assignment:
             form += '\n'
             form += '\n'
 
-            body += form
+            body.append(form)
 
-        return body.strip()
+        return ''.join(body).strip()
 
 
 class MetaCourse:
@@ -147,6 +162,8 @@ class Meta:
 
 
 class Student:
+    __slots__ = ('id', 'name', 'login')
+
     id: int
     name: str
     login: str
@@ -169,6 +186,8 @@ class Student:
 
 
 class Solution:
+    __slots__ = ('name', 'grade', 'bonus', 'points', 'feedback')
+
     grade: float
     points: float
 
@@ -214,6 +233,8 @@ class Solution:
 
 
 class GradingSheet:
+    __slots__ = ('name', 'students', 'solutions', '_grade', '_feedback')
+
     name: str
     students: List[Student]
 
@@ -221,6 +242,10 @@ class GradingSheet:
         self.name = name
         self.students = students
         self.solutions = solutions
+        # (template, grade) of the last get_grade, as sheets do not change once parsed
+        self._grade: tuple[Assignment, Any] | None = None
+        # (template, feedback) of the last format_md, for the same reason
+        self._feedback: tuple[Assignment, str] | None = None
 
     def serialize(self):
         return collections.OrderedDict(
@@ -242,8 +267,19 @@ class GradingSheet:
         return total
 
     def get_grade(self, ass: Assignment):
+        if self._grade is not None and self._grade[0] is ass:
+            return self._grade[1]
+        grade = self._compute_grade(ass)
+        self._grade = (ass, grade)
+        return grade
+
+    def remember_feedback(self, ass: Assignment, feedback: str) -> None:
+        """Make format_md return feedback rendered earlier for this sheet and template."""
+        self._feedback = (ass, feedback)
+
+    def _compute_grade(self, ass: Assignment):
         total = 0
-        tasks = {task.name: task for task in ass.tasks}
+        tasks = ass.task_index
         for sol in self.solutions:
             task = tasks[sol.name]
             grade = sol.get_grade(task)
@@ -262,7 +298,7 @@ def parse_sheet(data: str) -> GradingSheet:
     def flat(comseq):
         return sum([list(s.items()) for s in comseq], [])
 
-    struct = yaml.load(data)
+    struct = safe_load_yaml(data)
 
     assert len(struct) == 3, 'fields: name, students, solutions'
 
@@ -339,7 +375,7 @@ def create_sheet(template, students):
 
 
 def parse_meta(data: str) -> Meta:
-    struct = yaml.load(data)
+    struct = safe_load_yaml(data)
 
     course = MetaCourse(id=struct['course']['id'], name=struct['course']['name'])
 
@@ -353,6 +389,8 @@ def parse_meta(data: str) -> Meta:
 
 
 def parse_template(data: str) -> Assignment:
+    # Round-trip loading keeps the style of rubrics, which carries over into
+    # the grading sheets created from the template
     struct = yaml.load(data)
     tasks = []
     for t in struct['tasks']:
@@ -378,10 +416,99 @@ def parse_template(data: str) -> Assignment:
 
 
 def parse_students_and_tas(data) -> Tuple[List[str], List[List[str]]]:
-    struct = yaml.load(data)
+    struct = safe_load_yaml(data)
     tas = []
     stud: List[List[str]] = []
     for t, students in struct.items():
         tas.append(t)
         stud.append(list(filter(None, students)))
     return tas, stud
+
+
+# Emitting grading sheets
+#
+# emit_sheet_yaml writes the fixed shape of GradingSheet.serialize directly,
+# producing the same text as dump_yaml. It only handles scalars whose
+# representation is unambiguous, and returns None for anything else so the
+# sheet is dumped by ruamel.yaml instead.
+
+YAML_WIDTH = 80  # ruamel.yaml folds plain scalars on longer lines
+_PLAIN = re.compile(r"[^\W\d_][\w.@'-]*(?: [\w.@'-]+)*\Z")
+_NOT_PLAIN = frozenset(['true', 'True', 'TRUE', 'false', 'False', 'FALSE', 'null', 'Null', 'NULL'])
+_FLOAT = re.compile(r'-?\d+\.\d+\Z')
+_LITERAL_LINE = re.compile(
+    r'(?:[^\s\x00-\x1f\x7f-\x9f\ufeff\u2028\u2029]'
+    r'(?:[^\t\r\n\x00-\x1f\x7f-\x9f\ufeff\u2028\u2029]*'
+    r'[^\s\x00-\x1f\x7f-\x9f\ufeff\u2028\u2029])?)?\Z'
+)
+
+
+def _is_plain(text: str, column: int) -> bool:
+    return (
+        column + len(text) <= YAML_WIDTH
+        and _PLAIN.match(text) is not None
+        and text not in _NOT_PLAIN
+    )
+
+
+def _emit_scalar(value, column: int) -> str | None:
+    """Return what follows 'key:' for a one-line value starting at column."""
+    kind = type(value)
+    if value is None:
+        return '\n'
+    if kind is bool:
+        return ' true\n' if value else ' false\n'
+    if kind is int:
+        return f' {value}\n'
+    if kind is float:
+        text = repr(value)
+        return f' {text}\n' if _FLOAT.match(text) else None
+    if kind is str:
+        if value == '':
+            return " ''\n"
+        return f' {value}\n' if _is_plain(value, column) else None
+    return None
+
+
+def _emit_literal(value: LiteralScalarString, indent: int) -> str | None:
+    if getattr(value, 'comment', None) or value.anchor.value is not None:
+        return None
+    if not value.endswith('\n') or value.endswith('\n\n') or value[0] in ' \n':
+        return None
+    lines = value[:-1].split('\n')
+    if not all(_LITERAL_LINE.match(line) for line in lines):
+        return None
+    pad = ' ' * indent
+    return ' |\n' + ''.join(f'{pad}{line}\n' if line else '\n' for line in lines)
+
+
+def _emit_entries(parts: list[str], entries) -> bool:
+    """Append a sequence of single-key mappings, like the students of a sheet."""
+    for entry in entries:
+        [(key, fields)] = entry.items()
+        if not (type(key) is int or (type(key) is str and _is_plain(key, 4))):
+            return False
+        parts.append(f'  - {key}:\n')
+        for field, value in fields.items():
+            if type(value) is LiteralScalarString:
+                text = _emit_literal(value, 10)
+            else:
+                text = _emit_scalar(value, 6 + len(field) + 2)
+            if text is None:
+                return False
+            parts.append(f'      {field}:{text}')
+    return True
+
+
+def emit_sheet_yaml(data) -> str | None:
+    """Emit the YAML of a serialized GradingSheet, or None if it needs ruamel.yaml."""
+    name = _emit_scalar(data['name'], len('name: '))
+    if name is None or not data['students'] or not data['solutions']:
+        return None
+    parts = ['name:', name, 'students:\n']
+    if not _emit_entries(parts, data['students']):
+        return None
+    parts.append('solutions:\n')
+    if not _emit_entries(parts, data['solutions']):
+        return None
+    return ''.join(parts)
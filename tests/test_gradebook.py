@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from staffeli_nt import vas
+from staffeli_nt.console import console
+from staffeli_nt.gradebook import (
+    encode_sheet,
+    export_sheets,
+    file_digest,
+    import_sheets,
+    open_gradebook,
+    store_sheets,
+    warn_stale,
+)
+from staffeli_nt.util import dump_yaml
+
+TEMPLATE = """name: Test
+tasks:
+  - t1:
+      title: Task 1
+      points: 3
+      rubric: |
+        [+] good
+"""
+
+
+def write_sheet(path: str, sheet: vas.GradingSheet) -> None:
+    dump_yaml(path, sheet.serialize(), 'grading sheet', emit=vas.emit_sheet_yaml)
+
+
+def read_sheet(path: str) -> vas.GradingSheet:
+    with open(path, 'r', encoding='utf-8') as f:
+        return vas.parse_sheet(f.read())
+
+
+class GradebookTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        template = vas.parse_template(TEMPLATE)
+        self.sheets = []
+        for i in (1, 2):
+            student = SimpleNamespace(id=i, name=f'Student {i}', login_id=f'abc00{i}@ku.dk')
+            os.mkdir(os.path.join(self.root, f'abc00{i}'))
+            path = os.path.join(self.root, f'abc00{i}', 'grade.yml')
+            sheet = vas.create_sheet(template, [student])
+            write_sheet(path, sheet)
+            self.sheets.append((path, sheet))
+        self.path = self.sheets[0][0]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def grade_file(self, grade) -> None:
+        sheet = read_sheet(self.path)
+        sheet.solutions[0].grade = grade
+        write_sheet(self.path, sheet)
+
+    def row(self):
+        book = open_gradebook(self.root)
+        try:
+            return book.rows()[self.path]
+        finally:
+            book.close()
+
+    def test_download_stores_synced_rows(self):
+        store_sheets(self.root, self.sheets)
+        book = open_gradebook(self.root)
+        self.assertEqual(list(book.rows()), [path for path, _ in self.sheets])
+        self.assertEqual(book.stale_files(), [])
+        book.close()
+        self.assertEqual(self.row().version, 1)
+        self.assertEqual(self.row().file_version, 1)
+
+    def test_sheet_edited_after_import_is_stale(self):
+        import_sheets(self.root, force=False)
+        self.grade_file(2)
+
+        book = open_gradebook(self.root)
+        self.assertEqual(book.stale_files(), [self.path])
+        with console.capture() as capture:
+            warn_stale(book, self.root)
+        self.assertIn(self.path, capture.get())
+        book.close()
+
+        import_sheets(self.root, force=False)
+        book = open_gradebook(self.root)
+        self.assertEqual(book.stale_files(), [])
+        row = book.rows()[self.path]
+        self.assertEqual(row.version, 2)
+        self.assertEqual(row.file_version, 2)
+        self.assertEqual(book.decode(self.path, row.data).solutions[0].grade, 2)
+        book.close()
+
+    def test_export_keeps_sheet_edited_after_import(self):
+        import_sheets(self.root, force=False)
+        self.grade_file(2)
+        edited = file_digest(self.path)
+
+        export_sheets(self.root, force=False)
+        self.assertEqual(file_digest(self.path), edited)
+
+        export_sheets(self.root, force=True)
+        self.assertIsNone(read_sheet(self.path).solutions[0].grade)
+        book = open_gradebook(self.root)
+        self.assertEqual(book.stale_files(), [])
+        book.close()
+
+    def test_import_skips_row_changed_in_gradebook(self):
+        import_sheets(self.root, force=False)
+        # Another writer changes the row without syncing the file
+        book = open_gradebook(self.root)
+        with book.db:
+            book.db.execute('UPDATE sheets SET version = version + 1')
+        book.close()
+        self.grade_file(2)
+
+        import_sheets(self.root, force=False)
+        self.assertEqual(self.row().version, 2)
+        self.assertNotEqual(self.row().file_sha256, file_digest(self.path))
+
+        import_sheets(self.root, force=True)
+        self.assertEqual(self.row().version, 3)
+        self.assertEqual(self.row().file_sha256, file_digest(self.path))
+
+    def test_put_refuses_a_row_changed_since_it_was_read(self):
+        import_sheets(self.root, force=False)
+        book = open_gradebook(self.root)
+        read = book.rows()[self.path]
+        self.grade_file(2)
+        sheet = read_sheet(self.path)
+        with book.db:
+            self.assertTrue(book.put(self.path, encode_sheet(sheet), 'a', read))
+            self.assertFalse(book.put(self.path, encode_sheet(sheet), 'b', read))
+        book.close()
+        self.assertEqual(self.row().version, 2)
+        self.assertEqual(self.row().file_sha256, 'a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from staffeli_nt import console as con
+from staffeli_nt.ledger import FeedbackLedger, may_hold_feedback
+from staffeli_nt.upload import is_duplicate
+
+FEEDBACK = 'Task 1: 3 / 3 points\n\nNice work\n'
+
+
+def attachment(contents: bytes, name: str = 'feedback.txt') -> dict:
+    return {'id': 7001, 'display_name': name, 'size': len(contents), 'url': 'https://files/7001'}
+
+
+class MayHoldFeedbackTest(unittest.TestCase):
+    def test_same_text(self):
+        self.assertTrue(may_hold_feedback(attachment(FEEDBACK.encode()), FEEDBACK))
+
+    def test_only_surrounding_whitespace_differs(self):
+        self.assertTrue(may_hold_feedback(attachment(FEEDBACK.strip().encode()), FEEDBACK))
+        self.assertTrue(may_hold_feedback(attachment(FEEDBACK.encode() + b'\n'), FEEDBACK))
+
+    def test_smaller_than_the_feedback(self):
+        self.assertFalse(may_hold_feedback(attachment(b'Task 1'), FEEDBACK))
+
+    def test_other_names(self):
+        self.assertFalse(may_hold_feedback(attachment(FEEDBACK.encode(), 'main.py'), FEEDBACK))
+
+
+class IsDuplicateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = FeedbackLedger(os.path.join(self.tmp.name, 'feedback-ledger.jsonl'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def submission(self, contents: bytes) -> SimpleNamespace:
+        comment = {'comment': 'See attached file', 'attachments': [attachment(contents)]}
+        return SimpleNamespace(assignment_id=9, user_id=1, submission_comments=[comment])
+
+    def test_feedback_posted_with_a_trailing_newline(self):
+        contents = FEEDBACK.encode() + b'\n'
+        with mock.patch('staffeli_nt.upload.download', return_value=contents) as download:
+            duplicate = is_duplicate(
+                self.submission(contents), FEEDBACK, self.ledger, con.BufferedOutput()
+            )
+        self.assertTrue(duplicate)
+        download.assert_called_once()
+
+    def test_other_feedback(self):
+        contents = b'Task 1: 0 / 3 points\n\nMissing\n\n\n\n\n\n\n\n\n\n\n\n\n'
+        with mock.patch('staffeli_nt.upload.download', return_value=contents):
+            duplicate = is_duplicate(
+                self.submission(contents), FEEDBACK, self.ledger, con.BufferedOutput()
+            )
+        self.assertFalse(duplicate)
+
+
+if __name__ == '__main__':
+    unittest.main()
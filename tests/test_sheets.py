@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+from staffeli_nt.sheets import find_sheets, write_locations
+
+
+def touch(*parts: str) -> str:
+    path = os.path.join(*parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('name: Test\n')
+    return path
+
+
+class FindSheetsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.submissions = [touch(self.root, name, 'grade.yml') for name in ('abc001', 'abc002')]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_finds_submissions(self):
+        self.assertEqual(find_sheets(self.root), self.submissions)
+
+    def test_does_not_search_inside_a_submission(self):
+        touch(self.root, 'abc001', 'handin', 'grade.yml')
+        self.assertEqual(find_sheets(self.root), self.submissions)
+
+    def test_grade_yml_in_root_does_not_hide_submissions(self):
+        stray = touch(self.root, 'grade.yml')
+        self.assertEqual(find_sheets(self.root), sorted([stray, *self.submissions]))
+
+    def test_recorded_grade_yml_in_root_does_not_hide_submissions(self):
+        stray = touch(self.root, 'grade.yml')
+        write_locations(self.root, [stray, self.submissions[0]])
+        expected = sorted([stray, *self.submissions])
+        self.assertEqual(find_sheets(self.root), expected)
+        self.assertEqual(find_sheets(self.root + os.sep), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
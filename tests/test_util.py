@@ -0,0 +1,49 @@
+import unittest
+from types import SimpleNamespace
+
+from canvasapi.paginated_list import PaginatedList  # type: ignore[import-untyped]
+from canvasapi.user import User  # type: ignore[import-untyped]
+
+from staffeli_nt.util import paginate
+
+BASE = 'https://canvas.example/api/v1/'
+
+
+class PagedRequester:
+    """Serves a list of users as pages of two with numbered next and last links."""
+
+    def __init__(self, users: list[dict]):
+        self.users = users
+        self.requests: list[tuple[str, dict]] = []
+
+    def request(self, method, endpoint=None, _url=None, _kwargs=None, **kwargs):
+        url = _url or BASE + endpoint + '?page=1'
+        self.requests.append((url, kwargs))
+        page = int(url.rsplit('page=', 1)[1])
+        last = (len(self.users) + 1) // 2
+        links = {'last': {'url': f'{BASE}users?page={last}'}}
+        if page < last:
+            links['next'] = {'url': f'{BASE}users?page={page + 1}'}
+        users = self.users[2 * (page - 1) : 2 * page]
+        return SimpleNamespace(json=lambda: users, links=links)
+
+
+class PaginateTest(unittest.TestCase):
+    def setUp(self):
+        self.users = [{'id': i, 'name': f'Student {i}'} for i in range(1, 6)]
+        self.requester = PagedRequester(self.users)
+
+    def test_fetches_every_page(self):
+        paginated = PaginatedList(User, self.requester, 'GET', 'courses/1/users')
+        self.assertEqual([user.id for user in paginate(paginated, per_page=2)], [1, 2, 3, 4, 5])
+        self.assertEqual(self.requester.requests[0][1]['per_page'], 2)
+
+    def test_falls_back_without_the_private_attributes(self):
+        # A list from a canvasapi release whose PaginatedList is laid out differently
+        paginated = iter([User(self.requester, user) for user in self.users])
+        self.assertEqual([user.id for user in paginate(paginated)], [1, 2, 3, 4, 5])
+        self.assertEqual(self.requester.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()